@@ -0,0 +1,86 @@
+"""Shared FastAPI wiring for the weather agent entrypoints.
+
+Every entrypoint used to re-implement the same session middleware, health
+endpoint and UI router mounting. This factory keeps one canonical copy so
+performance fixes (async handlers, ORJSONResponse, session pooling) apply
+everywhere at once.
+"""
+import logging
+
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+def make_session_middleware(ui, default_session: str = "demo-session"):
+    """Create the canonical session middleware for a UIManager.
+
+    Resolution order: X-Session-ID header, `session` query param, default.
+    """
+    async def session_middleware(request: Request, call_next):
+        """Extract session ID and set it for streaming."""
+        session_id = (
+            request.headers.get("X-Session-ID") or
+            request.query_params.get("session") or
+            default_session
+        )
+        ui.set_session(session_id)
+        logger.debug("Session set: %s", session_id)
+        return await call_next(request)
+
+    return session_middleware
+
+
+def build_app(
+    ui,
+    *,
+    health_payload: dict,
+    title: str | None = None,
+    description: str | None = None,
+    lifespan=None,
+    default_session: str = "demo-session",
+) -> FastAPI:
+    """Build a FastAPI app with the shared middleware / UI / health wiring.
+
+    Args:
+        ui: The UIManager for this app
+        health_payload: Static dict returned by GET /health
+        title: Optional FastAPI title
+        description: Optional FastAPI description
+        lifespan: Optional lifespan override (defaults to ui.lifespan)
+        default_session: Session ID used when the request carries none
+
+    Returns:
+        The configured FastAPI app (agent endpoint not yet mounted).
+    """
+    kwargs = {}
+    if title is not None:
+        kwargs["title"] = title
+    if description is not None:
+        kwargs["description"] = description
+
+    app = FastAPI(
+        lifespan=lifespan or ui.lifespan,
+        default_response_class=ORJSONResponse,
+        **kwargs,
+    )
+
+    app.middleware("http")(make_session_middleware(ui, default_session))
+    app.include_router(ui.router)
+
+    @app.get("/health")
+    async def health():
+        """Health check endpoint."""
+        return health_payload
+
+    return app
+
+
+def build_adk_app(adk_agent, ui, **kwargs) -> FastAPI:
+    """Build the shared app and mount an ADK agent endpoint at '/'."""
+    from ag_ui_adk import add_adk_fastapi_endpoint
+
+    app = build_app(ui, **kwargs)
+    add_adk_fastapi_endpoint(app, adk_agent, path="/")
+    return app
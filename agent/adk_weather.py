@@ -1,50 +1,73 @@
 """ADK Weather Agent using LlmAgent with CopilotKit Integration."""
 
+import os
+
 from dotenv import load_dotenv
-load_dotenv()
+
+# Parse .env only once per process - modules importing each other (or tests
+# importing several entrypoints) shouldn't re-walk the filesystem.
+if not os.getenv("_DOTENV_LOADED"):
+    load_dotenv()
+    os.environ["_DOTENV_LOADED"] = "1"
 
 from google.adk.agents import LlmAgent
 from google.adk.tools import ToolContext
-from ag_ui_adk import ADKAgent, add_adk_fastapi_endpoint
-from fastapi import FastAPI, Request
+from ag_ui_adk import ADKAgent
 from sidd_agent_ui_sdk import UIManager
-import os
+from _app_factory import build_adk_app
+import asyncio
 import logging
 import random
+import time
 
 # Setup logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Initialize UI Manager
 ui = UIManager(graph_name="weather_app", ui_path="./ui/index.tsx")
 
+# Dedicated PRNG instance: avoids the lock on the global random module state
+_rng = random.Random()
+
+# Per-worker TTL cache for weather lookups: location -> (temp, expiry)
+# Workers don't share memory, so no lock is needed.
+_weather_cache: dict[str, tuple[int, float]] = {}
+_WEATHER_CACHE_TTL = 60.0  # seconds
+
 
 # ============================================================================
 # Tool Implementation
 # ============================================================================
 
-def get_weather(tool_context: ToolContext, location: str) -> dict:
-    """Get current weather information for a city.
-
-    Call this tool when the user asks about weather in any location.
-    This will return the current temperature for the specified city.
-
-    Args:
-        location: The city name (e.g., "Boston", "San Francisco")
-
-    Returns:
-        Dictionary with status, location, and temperature keys.
-        Example: {"status": "success", "location": "Boston", "temperature": 72}
-    """
-    logger.info(f"[get_weather] location={location}")
+async def _fetch_one(location: str) -> dict:
+    """Fetch weather for a single city and emit its UI card."""
+    # Lowercase once; reused for the component ID and the cache key
+    loc_key = location.lower()
+    component_id = f"weather-{loc_key}"
+    now = time.monotonic()
+
+    # Cache hit: skip the skeleton emit, just re-merge the known data
+    cached = _weather_cache.get(loc_key)
+    if cached and cached[1] > now:
+        temp = cached[0]
+        logger.info("[get_weather] cache hit for %s: %s", location, temp)
+        ui.emit("weather", {
+            "location": location,
+            "temp": temp
+        }, id=component_id, merge=True)
+        return {
+            "status": "success",
+            "location": location,
+            "temperature": temp
+        }
 
     # Generate random temperature
-    temp = random.randint(45, 70)
-    
+    temp = _rng.randint(45, 70)
+    _weather_cache[loc_key] = (temp, now + _WEATHER_CACHE_TTL)
+
     # STREAMING: Emit skeleton immediately
-    component_id = f"weather-{location.lower()}"
-    logger.info(f"📡 Emitting skeleton for {location}")
+    logger.info("📡 Emitting skeleton for %s", location)
     ui.emit("weather", {
         "location": location,
         "temp": "Loading..."
@@ -56,10 +79,10 @@ def get_weather(tool_context: ToolContext, location: str) -> dict:
         "temperature": temp
     }
 
-    logger.info(f"[get_weather] result={result}")
+    logger.info("[get_weather] result=%s", result)
 
     # Emit merge with real data
-    logger.info(f"🔄 Emitting merge for {location}")
+    logger.info("🔄 Emitting merge for %s", location)
     ui.emit("weather", {
         "location": location,
         "temp": temp
@@ -68,48 +91,39 @@ def get_weather(tool_context: ToolContext, location: str) -> dict:
     return result
 
 
-def push_ui_message(tool_context: ToolContext, component_name: str, props: dict) -> dict:
-    """Push a UI component to render in the chat.
+async def get_weather(tool_context: ToolContext, location: str) -> dict:
+    """Get current weather information for a city.
 
-    Call this tool to display a visual component in the chat interface.
-    This should be called AFTER get_weather to show the weather card in chat history.
+    Call this tool when the user asks about weather in any location.
+    This will return the current temperature for the specified city.
 
     Args:
-        component_name: Name of the component to render (e.g., "weather")
-        props: Props to pass to the component (e.g., {"location": "Boston", "temp": 72})
+        location: The city name (e.g., "Boston", "San Francisco")
 
     Returns:
-        Dictionary with status, graph_name, component_name, and props keys.
-        Example: {"status": "success", "graph_name": "weather_app", ...}
+        Dictionary with status, location, and temperature keys.
+        Example: {"status": "success", "location": "Boston", "temperature": 72}
     """
-    logger.info(f"[push_ui_message] component={component_name}, props={props}")
+    logger.info("[get_weather] location=%s", location)
+    return await _fetch_one(location)
 
-    result = {
-        "status": "success",
-        "graph_name": "weather_app",
-        "component_name": component_name,
-        "props": props
-    }
 
-    logger.info(f"[push_ui_message] result={result}")
-    return result
+async def get_weather_batch(tool_context: ToolContext, locations: list[str]) -> list[dict]:
+    """Get current weather information for several cities at once.
 
+    Call this tool when the user asks about weather in MULTIPLE locations.
+    All lookups run concurrently, so this is much faster than calling
+    get_weather once per city.
 
-# ============================================================================
-# Session Middleware
-# ============================================================================
+    Args:
+        locations: The city names (e.g., ["Boston", "San Francisco"])
 
-async def session_middleware(request: Request, call_next):
-    """Extract session ID and set it for streaming."""
-    session_id = (
-        request.headers.get("X-Session-ID") or
-        request.query_params.get("session") or
-        "demo-session"
-    )
-    ui.set_session(session_id)
-    logger.debug(f"Session set: {session_id}")
-    response = await call_next(request)
-    return response
+    Returns:
+        List of dictionaries with status, location, and temperature keys,
+        in the same order as the input locations.
+    """
+    logger.info("[get_weather_batch] locations=%s", locations)
+    return list(await asyncio.gather(*[_fetch_one(loc) for loc in locations]))
 
 
 # ============================================================================
@@ -123,29 +137,25 @@ weather_agent = LlmAgent(
     instruction="""You are a weather assistant that provides weather information with visual components.
 
 IMPORTANT WORKFLOW:
-When a user asks about weather, you MUST follow these steps IN ORDER:
-
-1. Call get_weather(location="City Name") to fetch the temperature
-2. Wait for the result
-3. Call push_ui_message(component_name="weather", props={"location": "City Name", "temp": <temperature>})
-   using the ACTUAL temperature from step 1
-4. Provide a brief, conversational response
+When a user asks about weather, call get_weather(location="City Name") to fetch the
+temperature. The weather card is rendered in the UI automatically - you do NOT need
+to call any other tool to display it.
 
 Example:
 User: "What's the weather in Boston?"
 
 Step 1: Call get_weather(location="Boston")
 Step 2: Receive {"status": "success", "location": "Boston", "temperature": 67}
-Step 3: Call push_ui_message(component_name="weather", props={"location": "Boston", "temp": 67})
-Step 4: Respond: "The weather in Boston is 67°F. I've displayed the weather card above."
+Step 3: Respond: "The weather in Boston is 67°F. I've displayed the weather card above."
 
 RULES:
-- ALWAYS call both tools for every weather request
-- Use the ACTUAL temperature from get_weather in push_ui_message
+- ALWAYS call get_weather for every weather request
+- When the user mentions MULTIPLE cities, call get_weather_batch(locations=[...])
+  once instead of calling get_weather repeatedly
 - Keep text responses concise and natural
 - Do not make up temperatures - use only what get_weather returns
 """,
-    tools=[get_weather, push_ui_message],
+    tools=[get_weather, get_weather_batch],
 )
 
 # Wrap in ADK middleware
@@ -157,23 +167,8 @@ adk_weather_agent = ADKAgent(
     use_in_memory_services=True
 )
 
-# Create FastAPI app
-app = FastAPI(lifespan=ui.lifespan)
-
-# Add session middleware
-app.middleware("http")(session_middleware)
-
-# Add UI router
-app.include_router(ui.router)
-
-# Add ADK agent endpoint
-add_adk_fastapi_endpoint(app, adk_weather_agent, path="/")
-
-
-@app.get("/health")
-def health():
-    """Health check endpoint."""
-    return {"status": "ok", "agent": "adk_llm"}
+# Create FastAPI app (shared session middleware / UI router / health wiring)
+app = build_adk_app(adk_weather_agent, ui, health_payload={"status": "ok", "agent": "adk_llm"})
 
 
 if __name__ == "__main__":
@@ -182,4 +177,18 @@ if __name__ == "__main__":
         print("⚠️  Set GOOGLE_API_KEY environment variable")
     port = int(os.getenv("PORT", 8000))
     print(f"\n🚀 Starting ADK Weather Agent (LlmAgent) on port {port}\n")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Import string (not the app object) is required for multi-worker mode.
+    uvicorn.run(
+        "adk_weather:app",
+        host="0.0.0.0",
+        port=port,
+        # SSE session queues, the weather caches and the prefetch table
+        # are all per-process and there is no sticky routing, so >1
+        # worker silently drops ui.emit events whenever the stream and
+        # the agent POST land on different workers. Opt in via
+        # UVICORN_WORKERS once the deployment has session affinity.
+        workers=int(os.getenv("UVICORN_WORKERS", "1")),
+        loop="uvloop",
+        http="httptools",
+        log_level=os.getenv("UVICORN_LOG_LEVEL", "warning"),
+    )
@@ -2,12 +2,20 @@
 
 from __future__ import annotations
 
+import os
+
 from dotenv import load_dotenv
-load_dotenv()
+
+# Parse .env only once per process - modules importing each other (or tests
+# importing several entrypoints) shouldn't re-walk the filesystem.
+if not os.getenv("_DOTENV_LOADED"):
+    load_dotenv()
+    os.environ["_DOTENV_LOADED"] = "1"
 import json
 from enum import Enum
 from typing import Dict, List, Any, Optional
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from ag_ui_adk import ADKAgent, add_adk_fastapi_endpoint
 
 # ADK imports
@@ -28,6 +36,15 @@ from enum import Enum
 # Import the UI SDK
 from sidd_agent_ui_sdk import UIManager
 
+import logging
+logger = logging.getLogger(__name__)
+
+# Cached compact serialization of the proverbs list. set_proverbs replaces the
+# list wholesale, so an `is` check against the cached list object detects every
+# update. Holding the list itself (not its id) also keeps it alive, so a
+# recycled address can never alias a different session's list.
+_proverbs_json_cache: tuple[list | None, str] = (None, "")
+
 
 class ProverbsState(BaseModel):
     """List of the proverbs being written."""
@@ -58,6 +75,10 @@ def set_proverbs(
         # Put this into a state object just to confirm the shape
         new_state = { "proverbs": new_proverbs}
         tool_context.state["proverbs"] = new_state["proverbs"]
+
+        # No cache invalidation needed: the new list is a different object,
+        # so the identity check in before_model_modifier misses naturally
+
         return {"status": "success", "message": "Proverbs updated successfully"}
 
     except Exception as e:
@@ -69,7 +90,7 @@ def get_weather(tool_context: ToolContext, location: str) -> Dict[str, str]:
     """Get the weather for a given location. Ensure location is fully spelled out."""
     import logging
     logger = logging.getLogger(__name__)
-    logger.info(f"[get_weather] Called with location: {location}")
+    logger.info("[get_weather] Called with location: %s", location)
     return {"status": "success", "message": f"The weather in {location} is sunny."}
 
 
@@ -90,6 +111,14 @@ def on_before_agent(callback_context: CallbackContext):
 
 
 
+# Precomputed pieces of the dynamic prompt prefix - only the serialized state
+# changes per turn, so the surrounding text is built once at import.
+_PREFIX_HEADER = """You are a helpful assistant for maintaining a list of proverbs.
+        This is the current state of the list of proverbs: """
+_PREFIX_FOOTER = """
+        When you modify the list of proverbs (wether to add, remove, or modify one or more proverbs), use the set_proverbs tool to update the list."""
+
+
 # --- Define the Callback Function ---
 #  modifying the agent's system prompt to incude the current state of the proverbs list
 def before_model_modifier(
@@ -100,16 +129,23 @@ def before_model_modifier(
     if agent_name == "ProverbsAgent":
         proverbs_json = "No proverbs yet"
         if "proverbs" in callback_context.state and callback_context.state["proverbs"] is not None:
-            try:
-                proverbs_json = json.dumps(callback_context.state["proverbs"], indent=2)
-            except Exception as e:
-                proverbs_json = f"Error serializing proverbs: {str(e)}"
+            proverbs = callback_context.state["proverbs"]
+            global _proverbs_json_cache
+            cached_list, cached_json = _proverbs_json_cache
+            if cached_list is proverbs:
+                proverbs_json = cached_json
+            else:
+                try:
+                    # Compact separators: pretty-printing only inflates the
+                    # prompt (bytes and tokens) sent to the model every turn
+                    proverbs_json = json.dumps(proverbs, separators=(",", ":"))
+                    _proverbs_json_cache = (proverbs, proverbs_json)
+                except Exception as e:
+                    proverbs_json = f"Error serializing proverbs: {str(e)}"
         # --- Modification Example ---
         # Add a prefix to the system instruction
         original_instruction = llm_request.config.system_instruction or types.Content(role="system", parts=[])
-        prefix = f"""You are a helpful assistant for maintaining a list of proverbs.
-        This is the current state of the list of proverbs: {proverbs_json}
-        When you modify the list of proverbs (wether to add, remove, or modify one or more proverbs), use the set_proverbs tool to update the list."""
+        prefix = "".join((_PREFIX_HEADER, proverbs_json, _PREFIX_FOOTER))
         # Ensure system_instruction is Content and parts list exists
         if not isinstance(original_instruction, types.Content):
             # Handle case where it might be a string (though config expects Content)
@@ -140,23 +176,19 @@ def simple_after_model_modifier(
 
     if agent_name == "ProverbsAgent":
         if llm_response.content and llm_response.content.parts:
-            # Check if there are any function calls in the response
-            has_function_calls = False
-            has_text = False
-
-            for part in llm_response.content.parts:
-                if hasattr(part, 'function_call') and part.function_call:
-                    has_function_calls = True
-                if hasattr(part, 'text') and part.text:
-                    has_text = True
+            # Check if there are any function calls in the response.
+            # any() short-circuits on the first matching part.
+            parts = llm_response.content.parts
+            has_function_calls = any(getattr(part, 'function_call', None) for part in parts)
+            has_text = any(getattr(part, 'text', None) for part in parts)
 
             # Only end invocation if we have text response and NO function calls
             # This allows the agent to make multiple tool calls
             if has_text and not has_function_calls:
-                print(f"[Callback] Ending invocation: has_text={has_text}, has_function_calls={has_function_calls}")
+                logger.debug("[Callback] Ending invocation: has_text=%s, has_function_calls=%s", has_text, has_function_calls)
                 callback_context._invocation_context.end_invocation = True
             else:
-                print(f"[Callback] Continuing: has_text={has_text}, has_function_calls={has_function_calls}")
+                logger.debug("[Callback] Continuing: has_text=%s, has_function_calls=%s", has_text, has_function_calls)
 
     return None
 
@@ -164,10 +196,11 @@ def simple_after_model_modifier(
 # Initialize UI Manager
 ui = UIManager(graph_name="proverbs_app", ui_path="./ui/index.tsx")
 
-proverbs_agent = LlmAgent(
-        name="ProverbsAgent",
-        model="gemini-2.5-flash",
-        instruction=f"""
+# Static instruction built once at import as a plain (non-f) string, so the
+# JSON examples below use literal single braces. All dynamic state (the
+# current proverbs list) is injected by before_model_modifier, not embedded
+# here; if parameters are ever needed, use .format_map on this template.
+_STATIC_INSTRUCTION = """
         When a user asks you to do anything regarding proverbs, you MUST use the set_proverbs tool.
 
         IMPORTANT RULES ABOUT PROVERBS AND THE SET_PROVERBS TOOL:
@@ -188,7 +221,7 @@ proverbs_agent = LlmAgent(
         IMPORTANT RULES ABOUT WEATHER:
         When the user asks about weather, you MUST call BOTH tools in the SAME turn (parallel):
         - get_weather(location="City Name")
-        - push_ui_message(component_name="weather", props={{"location": "City Name", "temp": 55}})
+        - push_ui_message(component_name="weather", props={"location": "City Name", "temp": 55})
 
         Do NOT respond with text until AFTER both tools complete. Only respond ONCE at the end.
 
@@ -196,9 +229,14 @@ proverbs_agent = LlmAgent(
         User: "What's the weather in San Francisco?"
         Actions in single turn:
         - Call get_weather(location="San Francisco")
-        - Call push_ui_message(component_name="weather", props={{"location": "San Francisco", "temp": 72}})
+        - Call push_ui_message(component_name="weather", props={"location": "San Francisco", "temp": 72})
         Then respond ONCE: "I've fetched the weather for San Francisco and displayed it above."
-        """,
+        """
+
+proverbs_agent = LlmAgent(
+        name="ProverbsAgent",
+        model="gemini-2.5-flash",
+        instruction=_STATIC_INSTRUCTION,
         tools=[set_proverbs, get_weather, ui.tool],
         before_agent_callback=on_before_agent,
         before_model_callback=before_model_modifier
@@ -214,7 +252,7 @@ adk_proverbs_agent = ADKAgent(
 )
 
 # Create FastAPI app with UI lifespan
-app = FastAPI(title="ADK Middleware Proverbs Agent", lifespan=ui.lifespan)
+app = FastAPI(title="ADK Middleware Proverbs Agent", lifespan=ui.lifespan, default_response_class=ORJSONResponse)
 
 # Add the UI router (for serving bundled UI components)
 app.include_router(ui.router)
@@ -233,4 +271,18 @@ if __name__ == "__main__":
         print()
 
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Import string (not the app object) is required for multi-worker mode.
+    uvicorn.run(
+        "agent:app",
+        host="0.0.0.0",
+        port=port,
+        # SSE session queues, the weather caches and the prefetch table
+        # are all per-process and there is no sticky routing, so >1
+        # worker silently drops ui.emit events whenever the stream and
+        # the agent POST land on different workers. Opt in via
+        # UVICORN_WORKERS once the deployment has session affinity.
+        workers=int(os.getenv("UVICORN_WORKERS", "1")),
+        loop="uvloop",
+        http="httptools",
+        log_level=os.getenv("UVICORN_LOG_LEVEL", "warning"),
+    )
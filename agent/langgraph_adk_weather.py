@@ -1,59 +1,82 @@
 """LangGraph + ADK Hybrid Weather Agent with SQLite Session Management."""
 
+import asyncio
 import os
 import logging
+import sqlite3
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from libs import LangGraphAgent
-from ag_ui_adk import ADKAgent, add_adk_fastapi_endpoint
+from ag_ui_adk import ADKAgent
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from google.adk.sessions import DatabaseSessionService
 
 # Import shared components
 from weather_shared import ui, create_weather_graph
+from _app_factory import build_adk_app
 
 # Setup logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 
-# ============================================================================
-# Session Middleware
-# ============================================================================
-
-async def session_middleware(request: Request, call_next):
-    """Extract session ID and set it for streaming."""
-    # session_id = (
-    #     request.headers.get("X-Session-ID") or
-    #     request.query_params.get("session") or
-    #     "demo-session"
-    # )
-    session_id="demo-session"
-    ui.set_session(session_id)
-    logger.debug(f"Session set: {session_id}")
-    response = await call_next(request)
-    return response
-
-
 # ============================================================================
 # ADK + LangGraph Hybrid Setup
 # ============================================================================
 
-# Create LangGraph workflow (Now uses weather_checkpoints.sqlite)
-logger.info("📊 Creating LangGraph workflow...")
-weather_graph = create_weather_graph()
-
-# Wrap LangGraph in ADK's LangGraphAgent
+# Wrap LangGraph in ADK's LangGraphAgent. Graph compilation is deferred to
+# lifespan so it happens exactly once, with the real checkpointer.
 logger.info("🔧 Wrapping LangGraph in ADK's LangGraphAgent...")
 adk_langgraph_agent = LangGraphAgent(
     name="WeatherAgent",
-    graph=weather_graph,
 )
 
 # Wrap in ADK middleware for FastAPI
 logger.info("🌐 Wrapping in ADK middleware...")
 
-session_service = DatabaseSessionService(db_url="sqlite:///adk_sessions_storage.db")
+ADK_SESSIONS_DB = "adk_sessions_storage.db"
+
+# Enable WAL once up front. journal_mode=WAL is persistent in the database
+# file, so reads won't block writes under concurrent workers.
+with sqlite3.connect(ADK_SESSIONS_DB) as _conn:
+    _conn.execute("PRAGMA journal_mode=WAL")
+    _conn.execute("PRAGMA synchronous=NORMAL")
+
+class ThreadOffloadSessionService(DatabaseSessionService):
+    """DatabaseSessionService that keeps SQLite I/O off the event loop.
+
+    The upstream methods are async but run synchronous SQLAlchemy calls
+    inline, blocking the loop for the full disk round-trip. Each override
+    executes the upstream coroutine inside a worker thread (with its own
+    private loop), so the request loop keeps multiplexing other work
+    during DB I/O.
+    """
+
+    async def create_session(self, *args, **kwargs):
+        return await asyncio.to_thread(asyncio.run, super().create_session(*args, **kwargs))
+
+    async def get_session(self, *args, **kwargs):
+        return await asyncio.to_thread(asyncio.run, super().get_session(*args, **kwargs))
+
+    async def list_sessions(self, *args, **kwargs):
+        return await asyncio.to_thread(asyncio.run, super().list_sessions(*args, **kwargs))
+
+    async def delete_session(self, *args, **kwargs):
+        return await asyncio.to_thread(asyncio.run, super().delete_session(*args, **kwargs))
+
+    async def append_event(self, *args, **kwargs):
+        return await asyncio.to_thread(asyncio.run, super().append_event(*args, **kwargs))
+
+
+# Extra kwargs are forwarded to SQLAlchemy's create_engine, giving us a
+# pooled engine instead of one connection per session lookup.
+session_service = ThreadOffloadSessionService(
+    db_url=f"sqlite:///{ADK_SESSIONS_DB}",
+    pool_size=20,
+    max_overflow=10,
+    pool_pre_ping=True,
+    connect_args={"check_same_thread": False},
+)
 # ============================================================================
 # ADK PERSISTENCE CONFIGURATION
 # ============================================================================
@@ -64,10 +87,7 @@ adk_weather_agent = ADKAgent(
     session_timeout_seconds=3600,
     session_service=session_service,
     # DISABLE In-Memory Services to enforce SQLite usage for ADK sessions
-    use_in_memory_services=True,
-    
-    # (Optional) If ADK allows specifying path, otherwise it defaults to local DB
-    # storage_path="./adk_sessions.db" 
+    use_in_memory_services=False,
 )
 
 @asynccontextmanager
@@ -79,7 +99,7 @@ async def lifespan(app: FastAPI):
     """
     # --- 1. DATABASE SETUP ---
     db_path = "weather_checkpoints.sqlite"
-    logger.info(f"🔌 Connecting to Async Checkpoint DB: {db_path}")
+    logger.info("🔌 Connecting to Async Checkpoint DB: %s", db_path)
 
     async with AsyncSqliteSaver.from_conn_string(db_path) as checkpointer:
         # A. Initialize DB
@@ -104,32 +124,20 @@ async def lifespan(app: FastAPI):
             
     logger.info("🛑 Database connection closed.")
 
-# Create FastAPI app
-app = FastAPI(
+# Create FastAPI app (shared session middleware / UI router / health wiring)
+app = build_adk_app(
+    adk_weather_agent,
+    ui,
+    health_payload={
+        "status": "ok",
+        "agent_type": "langgraph_adk_hybrid",
+        "features": ["langgraph_workflow", "adk_infrastructure", "memory_checkpointing", "streaming_ui"],
+    },
     title="LangGraph + ADK Hybrid Weather Agent",
     description="Weather agent using LangGraph workflows with ADK infrastructure",
-    lifespan=lifespan
+    lifespan=lifespan,
 )
 
-# Add session middleware
-app.middleware("http")(session_middleware)
-
-# Add UI router
-app.include_router(ui.router)
-
-# Add ADK endpoint
-add_adk_fastapi_endpoint(app, adk_weather_agent, path="/")
-
-
-@app.get("/health")
-def health():
-    """Health check endpoint."""
-    return {
-        "status": "ok",
-        "agent_type": "langgraph_adk_hybrid",
-        "features": ["langgraph_workflow", "adk_infrastructure", "memory_checkpointing", "streaming_ui"]
-    }
-
 
 if __name__ == "__main__":
     import uvicorn
@@ -150,4 +158,18 @@ if __name__ == "__main__":
     print(f"Running on http://0.0.0.0:{port}")
     print(f"{'='*80}\n")
 
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Import string (not the app object) is required for multi-worker mode.
+    uvicorn.run(
+        "langgraph_adk_weather:app",
+        host="0.0.0.0",
+        port=port,
+        # SSE session queues, the weather caches and the prefetch table
+        # are all per-process and there is no sticky routing, so >1
+        # worker silently drops ui.emit events whenever the stream and
+        # the agent POST land on different workers. Opt in via
+        # UVICORN_WORKERS once the deployment has session affinity.
+        workers=int(os.getenv("UVICORN_WORKERS", "1")),
+        loop="uvloop",
+        http="httptools",
+        log_level=os.getenv("UVICORN_LOG_LEVEL", "warning"),
+    )
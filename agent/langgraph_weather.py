@@ -3,13 +3,13 @@
 import os
 import sys
 import logging
-from fastapi import FastAPI, Request
 from copilotkit import CopilotKitRemoteEndpoint, LangGraphAGUIAgent
 from ag_ui_langgraph import add_langgraph_fastapi_endpoint
 from langchain_core.messages import HumanMessage
 
 # Import shared components
 from weather_shared import ui, create_weather_graph
+from _app_factory import build_app
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -23,37 +23,14 @@ logger = logging.getLogger()
 # Create the graph
 weather_graph = create_weather_graph()
 
-# Session middleware for streaming
-async def session_middleware(request: Request, call_next):
-    """Extract session ID and set it for streaming.
-
-    Phase 1: Uses demo-session for single-user scenarios
-    Phase 2: Will extract from auth headers for multi-user
-    """
-    # Try to get from header, query param, or use default
-    session_id = (
-        request.headers.get("X-Session-ID") or
-        request.query_params.get("session") or
-        "demo-session"  # Default for Phase 1
-    )
-    ui.set_session(session_id)
-    logger.debug(f"Session set: {session_id}")
-    response = await call_next(request)
-    return response
-
-# Create FastAPI app
-app = FastAPI(
+# Create FastAPI app (shared session middleware / UI router / health wiring)
+app = build_app(
+    ui,
+    health_payload={"status": "ok"},
     title="LangGraph Weather Agent",
     description="Weather agent built with LangGraph with STREAMING",
-    lifespan=ui.lifespan
 )
 
-# Add session middleware (IMPORTANT for streaming!)
-app.middleware("http")(session_middleware)
-
-# Add UI router (includes /ui/stream endpoint!)
-app.include_router(ui.router)
-
 # Create CopilotKit remote endpoint
 sdk = CopilotKitRemoteEndpoint(
     agents=[
@@ -76,12 +53,6 @@ add_langgraph_fastapi_endpoint(
 # add_fastapi_endpoint(app, sdk, "/copilotkit")
 
 
-@app.get("/health")
-def health():
-    """Health check endpoint."""
-    return {"status": "ok"}
-
-
 # ============================================================================
 # Standalone Runner (for testing)
 # ============================================================================
@@ -120,4 +91,21 @@ if __name__ == "__main__":
     # Run FastAPI server
     port = int(os.getenv("PORT", 8000))
     print(f"\n🚀 Starting LangGraph Weather Agent on port {port}\n")
-    uvicorn.run("langgraph_weather:app", host="0.0.0.0", port=port, reload=True)
+    if os.getenv("UVICORN_RELOAD"):
+        # Dev mode: auto-reload is incompatible with multiple workers.
+        uvicorn.run("langgraph_weather:app", host="0.0.0.0", port=port, reload=True)
+    else:
+        uvicorn.run(
+            "langgraph_weather:app",
+            host="0.0.0.0",
+            port=port,
+            # SSE session queues, the weather caches and the prefetch table
+            # are all per-process and there is no sticky routing, so >1
+            # worker silently drops ui.emit events whenever the stream and
+            # the agent POST land on different workers. Opt in via
+            # UVICORN_WORKERS once the deployment has session affinity.
+            workers=int(os.getenv("UVICORN_WORKERS", "1")),
+            loop="uvloop",
+            http="httptools",
+            log_level=os.getenv("UVICORN_LOG_LEVEL", "warning"),
+        )
@@ -1,15 +1,17 @@
 # Copyright 2025 Google LLC
 # ... (Keep License Header) ...
 
+import functools
 import json
 import logging
-from typing import AsyncGenerator, Union, Any, List
+from collections import defaultdict, deque
+from typing import AsyncGenerator, Optional, Union, Any, List
 
 from google.genai import types
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
 from langchain_core.runnables.config import RunnableConfig
 from langgraph.graph.state import CompiledStateGraph
-from pydantic import ConfigDict
+from pydantic import ConfigDict, PrivateAttr
 from typing_extensions import override
 
 from google.adk.events import Event
@@ -18,13 +20,32 @@ from google.adk.agents.invocation_context import InvocationContext
 
 logger = logging.getLogger(__name__)
 
+# A single turn never spans anywhere near this many events, so the reverse
+# scan for the latest human message is bounded instead of O(history).
+_MAX_TURN_LOOKBACK = 32
+
+# Cap on sessions held in the incremental conversation cache; beyond it
+# the least recently used session is evicted (a cold session just pays
+# one full rebuild on its next turn).
+_CONV_CACHE_MAX = 128
+
+# Tool outputs that can go straight into a FunctionResponse payload.
+# Exact-type check: subclasses may not serialize cleanly, and str() of a
+# plain value is the identity-ish fallback anyway.
+_JSON_OK = frozenset({str, dict, list, int, float, bool})
+
+_MISS = object()
+
 def _get_last_human_message(events: list[Event], agent_name: str) -> list[HumanMessage]:
     """
     Extracts the last VALID human message.
     - Stops if it hits an Agent message (turn is over).
     - Skips User events with no text (UI events/pings).
+    - Scans only the last _MAX_TURN_LOOKBACK events, falling back to a
+      full scan only if the window is inconclusive.
     """
-    for event in reversed(events):
+    window = events[-_MAX_TURN_LOOKBACK:] if len(events) > _MAX_TURN_LOOKBACK else events
+    for event in reversed(window):
         if event.author == agent_name:
             return []
 
@@ -36,7 +57,10 @@ def _get_last_human_message(events: list[Event], agent_name: str) -> list[HumanM
                     return [HumanMessage(content=part.text)]
                 # Ignore empty UI events
                 continue
-            
+
+    if window is not events:
+        # Pathological turn longer than the window: scan the remainder
+        return _get_last_human_message(events[:-_MAX_TURN_LOOKBACK], agent_name)
     return []
 
 class LangGraphAgent(BaseAgent):
@@ -49,8 +73,21 @@ class LangGraphAgent(BaseAgent):
         arbitrary_types_allowed=True,
     )
 
-    graph: CompiledStateGraph
+    # Optional so callers can defer compilation to app startup (lifespan)
+    # and assign the compiled graph before serving traffic.
+    graph: Optional[CompiledStateGraph] = None
     instruction: str = ''
+    # Emit text incrementally per streamed token chunk. Set False to buffer
+    # the whole response and emit a single text event at model end.
+    stream_tokens: bool = True
+
+    # Incremental conversation cache: session_id -> (events seen, messages).
+    # ADK session histories are append-only, so each turn only needs to
+    # convert the events added since the previous turn. Bounded LRU over
+    # the insertion-ordered dict (hits re-insert at the back, eviction
+    # from the front) so a long-lived process doesn't keep one growing
+    # message list per session forever.
+    _conv_cache: dict = PrivateAttr(default_factory=dict)
 
     @override
     async def _run_async_impl(
@@ -68,7 +105,7 @@ class LangGraphAgent(BaseAgent):
         config: RunnableConfig = {'configurable': {'thread_id': ctx.session.id}}
 
         # 2. Input Logic
-        messages = self._get_messages(ctx.session.events)
+        messages = self._get_messages(ctx.session.events, ctx.session.id)
         
         if not messages:
             return
@@ -79,135 +116,192 @@ class LangGraphAgent(BaseAgent):
                 messages.insert(0, SystemMessage(content=self.instruction))
 
         # 3. Streaming Logic
-        # We map Tool Call IDs to track them between "Call" and "Result" events
-        # Note: In streaming, matching these perfectly can be tricky. 
-        # We rely on the fact that LangGraph executes sequentially.
-        current_tool_calls = {}
+        # We map Tool Call IDs to track them between "Call" and "Result" events.
+        # A FIFO per tool name keeps IDs distinct when the same tool is called
+        # several times in one turn; LangGraph executes tools in order, so
+        # popping the oldest pending ID matches call to result.
+        current_tool_calls: defaultdict[str, deque] = defaultdict(deque)
+
+        # Handler table built once per invocation - the streaming loop below
+        # runs at token granularity, so per-event work is a single dict get
+        # instead of a string-comparison chain.
+        handlers = {
+            "on_chat_model_end": self._handle_chat_end,
+            "on_tool_end": self._handle_tool_end,
+        }
+
+        # Invocation-scoped event constructors: the identity kwargs and the
+        # Content/Part shape are fixed for the whole turn, so pre-bind them
+        # once instead of re-passing per streamed token.
+        new_event = functools.partial(
+            Event,
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+        )
+        _content = types.Content
+        _part_from_text = types.Part.from_text
+
+        def make_text_event(text: str, partial: bool = False) -> Event:
+            # partial=True marks streamed chunks so session services skip
+            # persisting them; only the full-text event at model end lands
+            # in history.
+            return new_event(
+                content=_content(role='model', parts=[_part_from_text(text=text)]),
+                partial=partial,
+            )
+
+        stream_tokens = self.stream_tokens
 
         async for event in self.graph.astream_events(
             {'messages': messages}, config, version="v2"
         ):
             event_type = event["event"]
-            event_data = event["data"]
-
-            # --- Case A: Model Decides to Call a Tool ---
             if event_type == "on_chat_model_stream":
-                # We generally wait for 'on_chat_model_end' for the full tool call
-                pass
-
-            elif event_type == "on_chat_model_end":
-                output = event_data.get("output")
-                
-                if output and isinstance(output, AIMessage):
-                    # 1. Handle Text Content
-                    if isinstance(output.content, str) and output.content.strip():
-                         yield self._create_text_event(ctx, output.content)
-                    
-                    elif isinstance(output.content, list):
-                        for block in output.content:
-                            if isinstance(block, dict):
-                                if block.get("type") == "text":
+                # Hottest event by far (one per token). Forward text chunks
+                # as they arrive so the UI's time-to-first-byte is the first
+                # token, not end of generation; tool calls still wait for
+                # 'on_chat_model_end'.
+                if stream_tokens:
+                    chunk = event["data"].get("chunk")
+                    if isinstance(chunk, AIMessageChunk) and chunk.content:
+                        content = chunk.content
+                        if isinstance(content, str):
+                            yield make_text_event(content, partial=True)
+                        elif isinstance(content, list):
+                            for block in content:
+                                if isinstance(block, dict) and block.get("type") == "text":
                                     text_val = block.get("text", "")
-                                    if text_val.strip():
-                                        yield self._create_text_event(ctx, text_val)
-
-                    # 2. Handle Tool Calls (The Official Way)
-                    # We Emit 'function_call' to trigger the UI "Calling..." state
-                    if output.tool_calls:
-                        for tool_call in output.tool_calls:
-                            t_id = tool_call["id"]
-                            t_name = tool_call["name"]
-                            t_args = tool_call["args"]
-                            
-                            # Store mapping for the response later
-                            current_tool_calls[t_name] = t_id
-
-                            yield Event(
-                                invocation_id=ctx.invocation_id,
-                                author=self.name,
-                                branch=ctx.branch,
-                                content=types.Content(
-                                    role='model',
-                                    parts=[
-                                        types.Part(
-                                            function_call=types.FunctionCall(
-                                                id=t_id,
-                                                name=t_name,
-                                                args=t_args
-                                            )
-                                        )
-                                    ]
-                                )
-                            )
+                                    if text_val:
+                                        yield make_text_event(text_val, partial=True)
+                continue
+
+            handler = handlers.get(event_type)
+            if handler is None:
+                continue
+            async for out_event in handler(event, current_tool_calls, new_event, make_text_event):
+                yield out_event
 
-            # --- Case B: Tool Execution Finished ---
-            elif event_type == "on_tool_end":
-                tool_output = event_data.get("output")
-                tool_name = event["name"]
-                
-                # Attempt to find the matching Call ID
-                # LangGraph v2 often doesn't pass the Call ID in 'on_tool_end'
-                # We assume the last seen call for this tool name is the one responding.
-                call_id = current_tool_calls.get(tool_name, "unknown_id")
-                
-                # Serialize Output
-                final_output = tool_output
-                if hasattr(tool_output, "content"): 
-                    final_output = tool_output.content
-                
-                if not isinstance(final_output, (str, dict, list, int, float, bool)):
-                    final_output = str(final_output)
-
-                # Emit Result
-                yield Event(
-                    invocation_id=ctx.invocation_id,
-                    author=self.name,
-                    branch=ctx.branch,
+    async def _handle_chat_end(
+        self, event, current_tool_calls, new_event, make_text_event
+    ) -> AsyncGenerator[Event, None]:
+        """Emit text content and tool-call events for a finished model turn."""
+        output = event["data"].get("output")
+        if not output or not isinstance(output, AIMessage):
+            return
+
+        # 1. Handle Text Content. The streamed chunks above are partial
+        # (never persisted), so this full-text event is the one copy that
+        # reaches session history.
+        if isinstance(output.content, str) and output.content.strip():
+            yield make_text_event(output.content)
+
+        elif isinstance(output.content, list):
+            for block in output.content:
+                if isinstance(block, dict):
+                    if block.get("type") == "text":
+                        text_val = block.get("text", "")
+                        if text_val.strip():
+                            yield make_text_event(text_val)
+
+        # 2. Handle Tool Calls (The Official Way)
+        # We Emit 'function_call' to trigger the UI "Calling..." state
+        if output.tool_calls:
+            for tool_call in output.tool_calls:
+                t_id = tool_call["id"]
+                t_name = tool_call["name"]
+                t_args = tool_call["args"]
+
+                # Store mapping for the response later
+                current_tool_calls[t_name].append(t_id)
+
+                yield new_event(
                     content=types.Content(
-                        role='function',
+                        role='model',
                         parts=[
                             types.Part(
-                                function_response=types.FunctionResponse(
-                                    id=call_id, # Must match the function_call ID
-                                    name=tool_name,
-                                    response={'result': final_output} 
+                                function_call=types.FunctionCall(
+                                    id=t_id,
+                                    name=t_name,
+                                    args=t_args
                                 )
                             )
                         ]
                     )
                 )
 
-    def _create_text_event(self, ctx, text: str) -> Event:
-        return Event(
-            invocation_id=ctx.invocation_id,
-            author=self.name,
-            branch=ctx.branch,
+    async def _handle_tool_end(
+        self, event, current_tool_calls, new_event, make_text_event
+    ) -> AsyncGenerator[Event, None]:
+        """Emit a function_response event for a finished tool execution."""
+        tool_output = event["data"].get("output")
+        tool_name = event["name"]
+
+        # Attempt to find the matching Call ID
+        # LangGraph v2 often doesn't pass the Call ID in 'on_tool_end'
+        # We assume the oldest pending call for this tool name is the
+        # one responding (tools run in call order).
+        pending = current_tool_calls.get(tool_name)
+        call_id = pending.popleft() if pending else "unknown_id"
+
+        # Serialize Output. Fast path: most tool outputs are already
+        # JSON-ready primitives - one frozenset membership test covers them.
+        if type(tool_output) in _JSON_OK:
+            final_output = tool_output
+        else:
+            content = getattr(tool_output, "content", _MISS)
+            final_output = tool_output if content is _MISS else content
+            if type(final_output) not in _JSON_OK:
+                final_output = str(final_output)
+
+        # Emit Result
+        yield new_event(
             content=types.Content(
-                role='model',
-                parts=[types.Part.from_text(text=text)],
-            ),
+                role='function',
+                parts=[
+                    types.Part(
+                        function_response=types.FunctionResponse(
+                            id=call_id, # Must match the function_call ID
+                            name=tool_name,
+                            response={'result': final_output}
+                        )
+                    )
+                ]
+            )
         )
 
     def _get_messages(
-        self, events: list[Event]
+        self, events: list[Event], session_id: Optional[str] = None
     ) -> list[Union[HumanMessage, AIMessage, SystemMessage]]:
         if self.graph.checkpointer:
             return _get_last_human_message(events, self.name)
         else:
-            return self._get_conversation_with_agent(events)
+            return self._get_conversation_with_agent(events, session_id)
 
     def _get_conversation_with_agent(
-        self, events: list[Event]
+        self, events: list[Event], session_id: Optional[str] = None
     ) -> list[Union[HumanMessage, AIMessage]]:
-        messages = []
-        for event in events:
+        # pop + re-insert below keeps hot sessions at the back of the dict
+        cached_len, cached_msgs = self._conv_cache.pop(session_id, (0, []))
+        if session_id is None or cached_len > len(events):
+            # No cache key, or the history shrank (session reset): full rebuild
+            cached_len, cached_msgs = 0, []
+
+        agent_name = self.name
+        messages = list(cached_msgs)
+        for event in events[cached_len:]:
             if not event.content or not event.content.parts:
                 continue
             part = event.content.parts[0]
             text = part.text if part.text else "..."
-            
+
             if event.author == 'user':
                 messages.append(HumanMessage(content=text))
-            elif event.author == self.name:
+            elif event.author == agent_name:
                 messages.append(AIMessage(content=text))
+
+        if session_id is not None:
+            if len(self._conv_cache) >= _CONV_CACHE_MAX:
+                self._conv_cache.pop(next(iter(self._conv_cache)), None)
+            self._conv_cache[session_id] = (len(events), list(messages))
         return messages
\ No newline at end of file
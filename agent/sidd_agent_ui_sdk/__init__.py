@@ -15,14 +15,41 @@ Example usage:
     app.include_router(ui.router)
 """
 
+import os
+
+# Install uvloop as the event loop policy when available - the SSE fan-out,
+# esbuild subprocess and LLM awaits are all loop-bound, and uvloop's
+# libuv-backed transports are a drop-in speedup. Opt out with
+# SIDD_UI_NO_UVLOOP=1 (e.g. when embedding in a host that manages its own loop).
+if not os.getenv("SIDD_UI_NO_UVLOOP"):
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
+import asyncio
+
 from .bundler import UIBundler, get_ui_bundler
 from .server import UIServer
 from .config import UIConfig
 from .manager import UIManager
 
+
+async def preload_all(managers: list) -> None:
+    """Pre-bundle several UIManagers' components concurrently.
+
+    The esbuild subprocesses are I/O-bound and independent, so gathering
+    them preloads a multi-graph app in roughly the time of its slowest
+    bundle instead of the sum of all of them.
+    """
+    await asyncio.gather(*(m.preload_bundle() for m in managers))
+
+
 __all__ = [
     # Simplified API (recommended)
     "UIManager",
+    "preload_all",
 
     # Advanced API (for customization)
     "UIBundler",
@@ -9,6 +9,7 @@ import asyncio
 import hashlib
 import logging
 import os
+import re
 from pathlib import Path
 from typing import Optional, Dict, Union
 import tempfile
@@ -16,6 +17,9 @@ import shutil
 
 logger = logging.getLogger(__name__)
 
+# Characters not allowed in a JS identifier, replaced with '_'
+_INVALID_JS = re.compile(r'[^A-Za-z0-9_]')
+
 
 def _which(cmd: str) -> Optional[str]:
     """Check if a command is available in PATH"""
@@ -25,15 +29,23 @@ def _which(cmd: str) -> Optional[str]:
 class UIBundler:
     """Service for bundling UI components using esbuild"""
 
-    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+    def __init__(self, cache_dir: Optional[Path] = None, max_disk_entries: int = 64) -> None:
         """Initialize the bundler
 
         Args:
             cache_dir: Directory for caching bundled components
+            max_disk_entries: Max cached bundles kept on disk (oldest pruned)
         """
         self._cache: Dict[str, str] = {}
+        # Inverse index for scoped invalidation: entry path -> cache keys
+        self._path_to_keys: Dict[Path, set] = {}
+        # Stat-based digest memo: path -> (mtime_ns, size, sha256 hexdigest)
+        self._hash_cache: Dict[Path, tuple] = {}
+        # Per-graph wrapper strings: graph_name -> (prefix, suffix)
+        self._wrapper_cache: Dict[str, tuple] = {}
         self._cache_dir = Path(cache_dir or Path(tempfile.gettempdir()) / "sidd-agent-ui-cache")
         self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._max_disk_entries = max_disk_entries
         self._esbuild_cmd = self._detect_esbuild()
 
     # ------------------------------- Public API -------------------------------
@@ -68,16 +80,79 @@ class UIBundler:
             logger.debug("Using cached bundle for %s (%s)", graph_name, component_path)
             return self._cache[cache_key]
 
+        # Disk cache: survives restarts, so a cold process skips the esbuild
+        # subprocess entirely when the entry file is unchanged
+        cache_path = self._cache_dir / f"{cache_key}.js"
+        if cache_path.exists():
+            logger.debug("Using disk-cached bundle for %s (%s)", graph_name, component_path)
+            wrapper = cache_path.read_text(encoding='utf-8')
+            self._cache[cache_key] = wrapper
+            self._path_to_keys.setdefault(component_path, set()).add(cache_key)
+            return wrapper
+
         # Bundle with esbuild (creates __SIDD_COMPONENT__ IIFE)
         bundled_code = await self._bundle_with_esbuild(component_path)
 
+        # Wrap with rendering interface (prefix/suffix cached per graph)
+        prefix, suffix = self._wrapper_parts(graph_name)
+        wrapper = prefix + bundled_code + suffix
+
+        self._cache[cache_key] = wrapper
+        self._path_to_keys.setdefault(component_path, set()).add(cache_key)
+        self._write_disk_cache(cache_path, wrapper)
+        return wrapper
+
+    async def bundle_many(self, entries) -> list:
+        """Bundle several components concurrently.
+
+        Each entry is a (graph_name, component_path) pair. esbuild invocations
+        run in parallel (capped at cpu_count concurrent subprocesses) so a
+        multi-graph app preloads in roughly the time of its slowest bundle.
+        """
+        sem = asyncio.Semaphore(os.cpu_count() or 4)
+
+        async def _one(graph_name, component_path):
+            async with sem:
+                return await self.bundle_component(graph_name, component_path)
+
+        return await asyncio.gather(*(_one(g, p) for g, p in entries))
+
+    def _write_disk_cache(self, cache_path: Path, wrapper: str) -> None:
+        """Atomically persist a bundle to the disk cache and prune old entries."""
+        try:
+            with tempfile.NamedTemporaryFile(
+                'w', encoding='utf-8', dir=self._cache_dir, suffix='.tmp', delete=False
+            ) as tmp:
+                tmp.write(wrapper)
+            os.replace(tmp.name, cache_path)
+
+            # Prune oldest entries beyond the cap
+            entries = sorted(self._cache_dir.glob('*.js'), key=lambda p: p.stat().st_mtime)
+            for old in entries[:-self._max_disk_entries]:
+                old.unlink(missing_ok=True)
+        except OSError as e:
+            # Disk cache is best-effort; the in-memory cache still holds the bundle
+            logger.warning("Failed to persist bundle cache to %s: %s", cache_path, e)
+
+    def _wrapper_parts(self, graph_name: str) -> tuple:
+        """Get the (prefix, suffix) wrapper strings for a graph.
+
+        Only the bundled code varies per content hash; the sanitized JS
+        identifier and the ~50-line rendering interface are computed once
+        per graph name and cached.
+        """
+        cached = self._wrapper_cache.get(graph_name)
+        if cached is not None:
+            return cached
+
         # Create valid JS identifier from graph name
-        valid_js_name = ''.join(c if c.isalnum() or c == '_' else '_' for c in graph_name)
+        valid_js_name = _INVALID_JS.sub('_', graph_name)
 
-        # Wrap with rendering interface
-        wrapper = f"""
+        prefix = f"""
 // Sidd Agent UI Component Wrapper for {graph_name}
-{bundled_code}
+"""
+
+        suffix = f"""
 
 // Initialize global shadow root registry
 window.__SIDD_SHADOW_ROOTS__ = window.__SIDD_SHADOW_ROOTS__ || new Map();
@@ -140,30 +215,46 @@ window.__LGUI_{valid_js_name} = {{
 }};
 """
 
-        self._cache[cache_key] = wrapper
-        return wrapper
+        parts = (prefix, suffix)
+        self._wrapper_cache[graph_name] = parts
+        return parts
 
     def invalidate_component(self, component_path: Union[Path, str, os.PathLike]) -> None:
-        """Invalidate the cache for a specific component.
+        """Invalidate cached bundles for a specific component.
+
+        Only entries derived from the given path are dropped (memory and
+        disk); other components' bundles survive, so multi-graph processes
+        don't cascade into re-bundling everything.
 
         Args:
             component_path: Path to the component file to invalidate
         """
-        self._cache.clear()
+        component_path = Path(component_path).expanduser().resolve()
+        self._hash_cache.pop(component_path, None)
+        for key in self._path_to_keys.pop(component_path, ()):
+            self._cache.pop(key, None)
+            (self._cache_dir / f"{key}.js").unlink(missing_ok=True)
         logger.info(f"Cache invalidated for component: {component_path}")
 
     # ------------------------------ Internal Methods -----------------------------
     def _get_file_hash(self, path: Union[Path, str, os.PathLike]) -> str:
-        """Get SHA256 hash of file contents"""
-        h = hashlib.sha256()
+        """Get SHA256 hash of file contents.
+
+        A (mtime_ns, size) stat check short-circuits the full file read when
+        the entry file hasn't changed since the last call.
+        """
         path = Path(path)
+        st = path.stat()
+        cached = self._hash_cache.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+
+        # file_digest hashes in C through OpenSSL (SHA-NI where available)
+        # and releases the GIL, unlike a Python-level read/update loop
         with open(path, 'rb') as f:
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                h.update(chunk)
-        return h.hexdigest()
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        self._hash_cache[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
 
     def _detect_esbuild(self) -> Optional[list]:
         """Return a command list usable with subprocess for esbuild, or None."""
@@ -186,61 +277,55 @@ window.__LGUI_{valid_js_name} = {{
         is_dev = os.getenv('SIDD_UI_ENV', 'dev').lower() in ('dev', 'development')
         target = os.getenv('SIDD_UI_TARGET', 'es2020')
 
-        with tempfile.TemporaryDirectory() as td:
-            # Create a wrapper entry file that includes React and ReactDOM
-            component_dir = entry.parent
-            wrapper_entry = component_dir / '.sidd_entry_temp.jsx'
-
-            try:
-                wrapper_entry.write_text(f"""
+        # Wrapper entry that includes React and ReactDOM, piped to esbuild on
+        # stdin - no temp file next to the user's sources, no cleanup, and
+        # concurrent bundles can't clobber each other's entry file.
+        component_dir = entry.parent
+        wrapper_src = f"""
 import React from 'react';
 import ReactDOM from 'react-dom/client';
 import components from './{entry.name}';
 
 export {{ React, ReactDOM }};
 export default components;
-""", encoding='utf-8')
-
-                out_file = Path(td) / 'bundle.js'
-
-                cmd = [
-                    *self._esbuild_cmd,
-                    str(wrapper_entry),
-                    '--bundle',
-                    '--format=iife',
-                    '--global-name=__SIDD_COMPONENT__',
-                    f'--target={target}',
-                    '--platform=browser',
-                    '--jsx=automatic',
-                    # Don't generate source maps at all to avoid 404 issues
-                    f'--outfile={out_file}',
-                ]
-
-                logger.debug("Running esbuild: %s", ' '.join(cmd))
-
-                try:
-                    proc = await asyncio.create_subprocess_exec(
-                        *cmd,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE,
-                    )
-                    stdout, stderr = await proc.communicate()
-                except Exception as e:
-                    raise RuntimeError(f"Failed to execute esbuild: {e}") from e
-
-                if proc.returncode != 0:
-                    raise RuntimeError(
-                        f"esbuild failed (code {proc.returncode}).\n"
-                        f"STDOUT:\n{stdout.decode()}\nSTDERR:\n{stderr.decode()}"
-                    )
-
-                code = out_file.read_text(encoding='utf-8')
-            finally:
-                # Clean up the temporary wrapper entry file
-                if wrapper_entry.exists():
-                    wrapper_entry.unlink()
-
-        return code
+"""
+
+        cmd = [
+            *self._esbuild_cmd,
+            '--bundle',
+            '--loader=jsx',
+            # Relative imports in the stdin entry resolve against the
+            # component's own directory
+            f'--resolve-dir={component_dir}',
+            '--format=iife',
+            '--global-name=__SIDD_COMPONENT__',
+            f'--target={target}',
+            '--platform=browser',
+            '--jsx=automatic',
+            # No --outfile: the bundle comes back on stdout, which also means
+            # no source map files to 404 on
+        ]
+
+        logger.debug("Running esbuild: %s", ' '.join(cmd))
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stdout, stderr = await proc.communicate(input=wrapper_src.encode())
+        except Exception as e:
+            raise RuntimeError(f"Failed to execute esbuild: {e}") from e
+
+        if proc.returncode != 0:
+            raise RuntimeError(
+                f"esbuild failed (code {proc.returncode}).\n"
+                f"STDERR:\n{stderr.decode()}"
+            )
+
+        return stdout.decode('utf-8')
 
 
 # Global singleton instance
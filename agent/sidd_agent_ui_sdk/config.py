@@ -1,4 +1,5 @@
 """Configuration management for UI components"""
+from functools import cached_property
 from pathlib import Path
 from typing import Optional, Union
 import os
@@ -17,9 +18,14 @@ class UIConfig:
         self.graph_name = graph_name
         self._ui_path = Path(ui_path)
 
-    @property
+    @cached_property
     def ui_path(self) -> Path:
-        """Get the absolute path to the UI component"""
+        """Get the absolute path to the UI component.
+
+        Resolution (up to three stat calls) runs once per config instance;
+        the filesystem layout doesn't change within a process lifetime. Call
+        invalidate_path_cache() if it does.
+        """
         if self._ui_path.is_absolute():
             return self._ui_path
 
@@ -38,6 +44,10 @@ class UIConfig:
         # Return original path and let caller handle if it doesn't exist
         return self._ui_path.resolve()
 
+    def invalidate_path_cache(self) -> None:
+        """Force ui_path to re-resolve on next access (e.g. after a move)"""
+        self.__dict__.pop('ui_path', None)
+
     def exists(self) -> bool:
         """Check if the UI component file exists"""
         return self.ui_path.exists()
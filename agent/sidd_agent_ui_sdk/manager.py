@@ -7,6 +7,7 @@ from contextlib import asynccontextmanager
 from contextvars import ContextVar
 import asyncio
 import json
+import time
 from uuid import uuid4
 
 from fastapi import FastAPI, Request, HTTPException
@@ -14,11 +15,67 @@ from fastapi.responses import StreamingResponse
 
 from .server import UIServer
 
+# orjson serializes the per-event dicts several times faster than stdlib
+# json and returns bytes directly; fall back to stdlib when not installed.
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # pragma: no cover - orjson is a normal dependency
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
 logger = logging.getLogger(__name__)
 
+# Wire format for SSE frames. 'msgpack' packs each event as
+# base64(msgpack) - 30-60% smaller payloads and faster encode for
+# high-frequency merge streams, at the cost of a client-side decoder.
+# The active format is advertised via the X-Sidd-Wire response header.
+_WIRE = os.getenv("SIDD_UI_WIRE", "json").lower()
+if _WIRE == "msgpack":
+    try:
+        import base64
+        import msgpack
+
+        def _encode_event(evt) -> bytes:
+            return b"data: " + base64.b64encode(msgpack.packb(evt)) + b"\n\n"
+    except ImportError:
+        logger.warning("SIDD_UI_WIRE=msgpack but msgpack is not installed; using json")
+        _WIRE = "json"
+
+if _WIRE != "msgpack":
+    _WIRE = "json"
+
+    def _encode_event(evt) -> bytes:
+        return b"data: " + _dumps(evt) + b"\n\n"
+
 # Session context for framework-agnostic session tracking
 _session_id: ContextVar[str | None] = ContextVar('session_id', default=None)
 
+# Max events drained per SSE flush - bounds added latency from coalescing
+_MAX_BATCH = 32
+
+# Per-session queue bound - a slow or disconnected SSE consumer can't grow
+# a queue without limit; the oldest events are dropped on overflow
+_QUEUE_MAX = int(os.getenv("SIDD_UI_QUEUE_MAX", "1024"))
+
+
+def _new_queue() -> asyncio.Queue:
+    return asyncio.Queue(maxsize=_QUEUE_MAX)
+
+
+def _put_event(queue: asyncio.Queue, evt: dict) -> None:
+    """Enqueue without blocking; on a full queue, discard the oldest event."""
+    try:
+        queue.put_nowait(evt)
+    except asyncio.QueueFull:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        queue.put_nowait(evt)
+
 
 class UIManager:
     """Simplified manager for UI components with all-in-one setup.
@@ -57,6 +114,8 @@ class UIManager:
         )
         self.graph_name = graph_name
         self._sessions: dict[str, asyncio.Queue] = {}  # Streaming support
+        self._session_last_seen: dict[str, float] = {}  # Idle-session eviction
+        self.session_timeout_seconds = 3600.0
         self._add_streaming_endpoint()  # Add SSE endpoint to router
 
     def _add_streaming_endpoint(self):
@@ -80,6 +139,7 @@ class UIManager:
                     "Cache-Control": "no-cache",
                     "Connection": "keep-alive",
                     "Access-Control-Allow-Origin": "*",
+                    "X-Sidd-Wire": _WIRE,
                 },
             )
 
@@ -105,18 +165,41 @@ class UIManager:
         """
         @asynccontextmanager
         async def _lifespan(app: FastAPI):
-            # Startup: Pre-bundle UI components
+            # Startup: Pre-bundle UI components in the background - the
+            # server starts accepting traffic (health checks included)
+            # immediately, and an early component request simply waits on
+            # the server's bundle lock until preloading lands.
             print("\n" + "="*60)
             print(f"🚀 Starting UI Server for '{self.graph_name}'")
-            print("="*60)
-            await self._server.preload_bundle()
             print("="*60 + "\n")
-            yield
+            preload_task = asyncio.create_task(self._server.preload_bundle())
+            cleanup_task = asyncio.create_task(self._cleanup_idle_sessions())
+            try:
+                yield
+            finally:
+                preload_task.cancel()
+                cleanup_task.cancel()
             # Shutdown: cleanup if needed
             print(f"\n👋 Shutting down UI Server for '{self.graph_name}'")
 
         return _lifespan
 
+    async def _cleanup_idle_sessions(self, interval: float = 60.0):
+        """Background task: evict session queues idle longer than the timeout.
+
+        Without this, every session ID ever seen keeps its queue (and any
+        undelivered events) alive for the life of the process.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = time.monotonic() - self.session_timeout_seconds
+            stale = [sid for sid, seen in self._session_last_seen.items() if seen < cutoff]
+            for sid in stale:
+                self._sessions.pop(sid, None)
+                self._session_last_seen.pop(sid, None)
+            if stale:
+                logger.info("Evicted %d idle session(s)", len(stale))
+
     async def preload_bundle(self):
         """Manually pre-bundle the UI component (if not using lifespan)"""
         return await self._server.preload_bundle()
@@ -138,13 +221,31 @@ class UIManager:
             session_id: Unique session identifier
         """
         _session_id.set(session_id)
+        # Established sessions only get their idle timestamp touched;
+        # the queue is allocated once on first sight.
         if session_id not in self._sessions:
-            self._sessions[session_id] = asyncio.Queue()
+            self._sessions[session_id] = _new_queue()
+        self._session_last_seen[session_id] = time.monotonic()
+
+    def close_session(self, session_id: str):
+        """Drop a session's queue and any undelivered events.
+
+        Call this when a session is known to be finished; idle sessions are
+        otherwise only reclaimed by the background timeout sweep.
+
+        Args:
+            session_id: Session to close
+        """
+        self._sessions.pop(session_id, None)
+        self._session_last_seen.pop(session_id, None)
 
     def emit(self, component_name: str, props: dict, id: str | None = None, merge: bool = False):
         """Emit a UI component update (framework-agnostic streaming)
 
         This is the simple API for agents to call. Works with any framework.
+        It is fire-and-forget: the event is enqueued with put_nowait and the
+        SSE stream drains it asynchronously, so calling emit() from a hot
+        tool path never blocks the agent loop.
 
         Args:
             component_name: Name of the component to render
@@ -174,10 +275,43 @@ class UIManager:
         }
 
         if session_id in self._sessions:
-            self._sessions[session_id].put_nowait(evt)
+            _put_event(self._sessions[session_id], evt)
             action = "Merged" if merge else "Emitted"
             logger.info(f"{action} UI event: {component_name} (id={evt['id']}) to session {session_id}")
 
+    def session_emitter(self, session_id: str):
+        """Return an emit closure bound to one session's queue.
+
+        emit() pays a ContextVar read plus two dict lookups per call; for
+        agents pushing many merge-updates per turn, the returned closure
+        captures the queue directly so each event is a single enqueue.
+
+        Args:
+            session_id: Session the emitter is bound to
+
+        Example:
+            emit = ui.session_emitter(session_id)
+            for reading in readings:
+                emit("gauge", {"value": reading}, id="g1", merge=True)
+        """
+        queue = self._sessions.get(session_id)
+        if queue is None:
+            queue = self._sessions[session_id] = _new_queue()
+        self._session_last_seen[session_id] = time.monotonic()
+        graph_name = self.graph_name
+
+        def _emit(component_name: str, props: dict, id: str | None = None, merge: bool = False):
+            _put_event(queue, {
+                "type": "ui",
+                "id": id or str(uuid4()),
+                "graph_name": graph_name,
+                "component_name": component_name,
+                "props": props,
+                "merge": merge,
+            })
+
+        return _emit
+
     def remove(self, id: str):
         """Remove a UI component by ID
 
@@ -198,9 +332,31 @@ class UIManager:
         }
 
         if session_id in self._sessions:
-            self._sessions[session_id].put_nowait(evt)
+            _put_event(self._sessions[session_id], evt)
             logger.info(f"Removed UI component: {id} from session {session_id}")
 
+    @staticmethod
+    def _coalesce(batch: list[dict]) -> list[dict]:
+        """Fold merge updates targeting the same component into one frame.
+
+        Rapid emit(..., merge=True) calls for the same id collapse into the
+        earlier pending frame for that id, so the client gets one render
+        instead of N. Event order is otherwise preserved.
+        """
+        folded: list[dict] = []
+        pending: dict[str, dict] = {}
+        for evt in batch:
+            if evt.get("type") == "ui":
+                prev = pending.get(evt["id"])
+                if prev is not None and evt.get("merge"):
+                    # Replace (not mutate) props - the original dict belongs
+                    # to the emitting caller
+                    prev["props"] = {**prev["props"], **evt["props"]}
+                    continue
+                pending[evt["id"]] = evt
+            folded.append(evt)
+        return folded
+
     async def stream_events(self, session_id: str):
         """SSE generator for streaming events to frontend
 
@@ -212,18 +368,32 @@ class UIManager:
         """
         # Ensure session queue exists
         if session_id not in self._sessions:
-            self._sessions[session_id] = asyncio.Queue()
+            self._sessions[session_id] = _new_queue()
 
         queue = self._sessions[session_id]
 
         try:
             while True:
-                # Wait for next event (blocks until available)
-                evt = await queue.get()
-
-                # Format as SSE
-                yield f"data: {json.dumps(evt)}\n\n"
+                # Wait for next event (blocks until available), then drain
+                # whatever else is already queued so bursts flush together
+                batch = [await queue.get()]
+                while len(batch) < _MAX_BATCH:
+                    try:
+                        batch.append(queue.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
+
+                # Format as SSE (bytes - StreamingResponse passes them
+                # through). The whole batch goes out as one payload so the
+                # transport does a single write/drain cycle per flush
+                # instead of one per frame.
+                if len(batch) > 1:
+                    yield b"".join(map(_encode_event, self._coalesce(batch)))
+                else:
+                    yield _encode_event(batch[0])
         except asyncio.CancelledError:
-            # Client disconnected
+            # Client disconnected - drop the queue so an abandoned session
+            # doesn't hold undelivered events until the idle sweep
             logger.info(f"Stream cancelled for session {session_id}")
+            self.close_session(session_id)
             raise
@@ -1,4 +1,7 @@
 """FastAPI server integration for UI components"""
+import asyncio
+import gzip
+import hashlib
 import json
 import logging
 import re
@@ -12,8 +15,64 @@ from fastapi.responses import Response
 from .config import UIConfig
 from .bundler import get_ui_bundler
 
+# Brotli beats gzip by ~20% on JS text; optional, gzip is always available
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# orjson for the per-request component name/props serialization; fall back
+# to compact stdlib json when not installed. OPT_NON_STR_KEYS matches
+# stdlib behavior for props dicts with e.g. int keys, which orjson would
+# otherwise reject.
+try:
+    import orjson
+
+    _DUMP = orjson.dumps
+    _NON_STR_KEYS = orjson.OPT_NON_STR_KEYS
+
+    def _json_str(obj) -> str:
+        return _DUMP(obj, option=_NON_STR_KEYS).decode()
+
+    _json_loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is a normal dependency
+    def _json_str(obj) -> str:
+        return json.dumps(obj, separators=(',', ':'))
+
+    _json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 
+# Characters not allowed in a JS identifier, replaced with '_'
+_INVALID_JS = re.compile(r'[^a-zA-Z0-9]')
+
+# Hosts served over plain http in local development
+_LOCAL_HOSTS = ("localhost", "127.0.0.1")
+
+# Shared CORS headers. Max-Age lets the browser cache preflights for a day
+# instead of paying an extra RTT before every cross-origin POST.
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Max-Age": "86400",
+}
+
+
+class _BundleResponse(Response):
+    """Response whose header bytes are frozen ahead of time.
+
+    The bundle endpoint serves fixed bytes with fixed headers between
+    invalidations; skipping Response.__init__ avoids re-encoding the
+    header dict and media type on every hit.
+    """
+
+    def __init__(self, content: bytes, raw_headers: list) -> None:
+        self.status_code = 200
+        self.body = content
+        self.raw_headers = raw_headers
+        self.background = None
+
 
 class UIServer:
     """Server for dynamically bundling and serving UI components
@@ -43,188 +102,256 @@ class UIServer:
             preload: Whether to pre-bundle components on initialization (default: True)
         """
         self.config = UIConfig(graph_name=graph_name, ui_path=ui_path)
+        # graph_name is fixed for this server, so sanitize it once
+        self._valid_js_name = _INVALID_JS.sub('_', graph_name)
+        # Script-tag template: only protocol, host and the JSON-encoded
+        # component name/props vary per request
+        self._script_tpl = (
+            '<script src="%s//%s/ui/' + graph_name + '/entrypoint.js" '
+            "onload='__LGUI_" + self._valid_js_name
+            + '.render(%s, "{{shadowRootId}}", %s)\'></script>'
+        )
+        # Invalidate-endpoint body is constant for this server: encode once
+        self._invalidate_ok = _json_str({
+            "status": "success",
+            "message": f"Cache invalidated for graph '{graph_name}'",
+        }).encode()
         self.router = APIRouter(prefix=prefix)
         self._setup_routes()
         self._preload = preload
+        # Pre-compressed bundle variants: bundle digest -> {encoding: bytes}.
+        # Compression runs once per bundle; requests only pick a variant.
+        self._encoded_cache: tuple[Optional[str], dict] = (None, {})
+        # Steady-state fast path: (etag, variants) held at the server level
+        # so hits skip the bundler (and its hashing/stat work) entirely.
+        # Cleared by the invalidate endpoint, repopulated on the next miss.
+        self._cached: Optional[tuple] = None
+        self._bundle_lock = asyncio.Lock()
 
     def _setup_routes(self):
-        """Setup FastAPI routes"""
+        """Setup FastAPI routes.
+
+        The graph name is baked into the route paths as a literal, so
+        requests for any other graph 404 inside the router's compiled
+        path matching and never reach a handler body.
+        """
+        base = f"/ui/{self.config.graph_name}"
 
-        @self.router.get("/ui/{graph_name}/entrypoint.js")
-        async def get_ui_entrypoint(graph_name: str):
+        @self.router.get(f"{base}/entrypoint.js")
+        async def get_ui_entrypoint(request: Request):
             """Get bundled UI component entrypoint (GET method)"""
-            return await self._serve_ui_component(graph_name)
+            return await self._serve_ui_component(request)
 
-        @self.router.post("/ui/{graph_name}/entrypoint.js")
-        async def post_ui_entrypoint(graph_name: str):
+        @self.router.post(f"{base}/entrypoint.js")
+        async def post_ui_entrypoint(request: Request):
             """Get bundled UI component entrypoint (POST method)"""
-            return await self._serve_ui_component(graph_name)
+            return await self._serve_ui_component(request)
 
-        @self.router.post("/ui/{graph_name}")
-        async def post_ui_component(graph_name: str, request: Request):
+        @self.router.post(base)
+        async def post_ui_component(request: Request):
             """Serve UI HTML with script tag"""
-            return await self._serve_ui_html(graph_name, request)
+            return await self._serve_ui_html(request)
 
-        @self.router.options("/ui/{graph_name}")
-        async def options_ui_component(graph_name: str):
+        @self.router.options(base)
+        async def options_ui_component():
             """Handle CORS preflight for UI component endpoint"""
-            return Response(
-                status_code=200,
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "POST, OPTIONS",
-                    "Access-Control-Allow-Headers": "*",
-                },
-            )
+            return Response(status_code=200, headers=CORS_HEADERS)
 
-        @self.router.options("/ui/{graph_name}/entrypoint.js")
-        async def options_ui_entrypoint(graph_name: str):
+        @self.router.options(f"{base}/entrypoint.js")
+        async def options_ui_entrypoint():
             """Handle CORS preflight for entrypoint endpoint"""
-            return Response(
-                status_code=200,
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-                    "Access-Control-Allow-Headers": "*",
-                },
-            )
+            return Response(status_code=200, headers=CORS_HEADERS)
 
-        @self.router.get("/ui/{graph_name}/invalidate")
-        async def invalidate_ui_cache(graph_name: str):
+        @self.router.get(f"{base}/invalidate")
+        async def invalidate_ui_cache():
             """Invalidate the UI component cache"""
-            if graph_name != self.config.graph_name:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"No UI component configured for graph '{graph_name}'"
-                )
-
             bundler = get_ui_bundler()
             bundler.invalidate_component(self.config.ui_path)
+            self._cached = None
 
-            return {
-                "status": "success",
-                "message": f"Cache invalidated for graph '{graph_name}'"
-            }
+            # Precomputed bytes: skips FastAPI's jsonable_encoder + stdlib dump
+            return Response(self._invalidate_ok, media_type="application/json")
 
-    async def _serve_ui_component(self, graph_name: str) -> Response:
+    async def _serve_ui_component(self, request: Optional[Request] = None) -> Response:
         """Internal function to serve bundled UI component
 
         Args:
-            graph_name: Name of the graph to get UI component for
+            request: Incoming request (used for Accept-Encoding negotiation)
 
         Returns:
             Response with bundled JavaScript code
 
         Raises:
-            HTTPException: If graph not found or UI not configured
+            HTTPException: If the UI component is missing or bundling fails
         """
-        logger.info(f"UI component requested for graph: {graph_name}")
-
-        # Check if this is the configured graph
-        if graph_name != self.config.graph_name:
-            logger.warning(f"No UI component configured for graph: {graph_name}")
-            raise HTTPException(
-                status_code=404,
-                detail=f"No UI component configured for graph '{graph_name}'"
+        logger.debug("UI component requested for graph: %s", self.config.graph_name)
+
+        # Steady-state fast path: between invalidations the response bytes
+        # are fixed, so skip the bundler (and its stat/hash work) entirely
+        cached = self._cached
+        if cached is None:
+            cached = await self._rebuild_cached()
+        etag, variants, raw_headers = cached
+
+        # Revalidation: the bundle only changes on invalidation, so a
+        # matching If-None-Match collapses the response to a bodyless 304
+        if request is not None and request.headers.get("if-none-match") == etag:
+            return Response(
+                status_code=304,
+                headers={
+                    "ETag": etag,
+                    "Cache-Control": "public, max-age=3600, must-revalidate",
+                    "Access-Control-Allow-Origin": "*",
+                    "Vary": "Accept-Encoding",
+                },
             )
 
-        # Check if component file exists
-        if not self.config.exists():
-            logger.error(f"UI component file not found: {self.config.ui_path}")
-            raise HTTPException(
-                status_code=404,
-                detail=f"UI component file not found for graph '{graph_name}'"
-            )
+        accept = request.headers.get("accept-encoding", "") if request else ""
+        encoding = "identity"
+        if "br" in accept and "br" in variants:
+            encoding = "br"
+        elif "gzip" in accept:
+            encoding = "gzip"
 
-        # Bundle the component
-        try:
-            import time
-            start_time = time.time()
+        # Headers (including Content-Length) were frozen when the cache
+        # was rebuilt - no per-request header assembly
+        return _BundleResponse(variants[encoding], raw_headers[encoding])
 
-            bundler = get_ui_bundler()
-            bundled_code = await bundler.bundle_component(graph_name, self.config.ui_path)
-
-            elapsed = time.time() - start_time
-            logger.info(f"[UI Bundler] Bundled {graph_name} in {elapsed:.2f}s")
-            print(f"[UI Bundler] Bundled {graph_name} in {elapsed:.2f}s")
-        except FileNotFoundError as e:
-            logger.error(f"Component file not found: {e}")
-            raise HTTPException(status_code=404, detail=str(e))
-        except Exception as e:
-            logger.error(f"Error bundling UI component: {e}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error bundling UI component: {str(e)}"
-            )
+    async def _rebuild_cached(self) -> tuple:
+        """Bundle, compress and cache the (etag, variants) response tuple.
 
-        # Return bundled JavaScript
-        return Response(
-            content=bundled_code,
-            media_type="application/javascript; charset=utf-8",
-            headers={
-                "Cache-Control": "public, max-age=3600, must-revalidate",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-                "Access-Control-Allow-Headers": "*",
-                "X-Content-Type-Options": "nosniff",
-                "Content-Type": "application/javascript; charset=utf-8",
+        The lock keeps a burst of cold requests from stampeding esbuild;
+        whoever wins populates the cache and the rest reuse it.
+        """
+        async with self._bundle_lock:
+            if self._cached is not None:
+                return self._cached
+
+            # No exists() pre-check: the bundler stats the file itself and
+            # raises FileNotFoundError, which maps to the same 404 below.
+            # Bundle the component. Timing only when INFO is on - warm bundler
+            # hits return in microseconds and shouldn't pay for formatting.
+            try:
+                import time
+                timing = logger.isEnabledFor(logging.INFO)
+                if timing:
+                    t0 = time.perf_counter()
+
+                bundler = get_ui_bundler()
+                bundled_code = await bundler.bundle_component(
+                    self.config.graph_name, self.config.ui_path
+                )
+
+                if timing:
+                    logger.info(
+                        "[UI Bundler] Bundled %s in %.2fs",
+                        self.config.graph_name, time.perf_counter() - t0,
+                    )
+            except FileNotFoundError as e:
+                logger.error(f"Component file not found: {e}")
+                raise HTTPException(status_code=404, detail=str(e))
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.error(f"Error bundling UI component: {e}")
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Error bundling UI component: {str(e)}"
+                )
+
+            etag, variants = await self._get_encoded_variants(bundled_code)
+            etag = f'"{etag}"'
+            raw_headers = {
+                enc: self._freeze_headers(etag, enc, body)
+                for enc, body in variants.items()
             }
-        )
+            self._cached = (etag, variants, raw_headers)
+            return self._cached
+
+    @staticmethod
+    def _freeze_headers(etag: str, encoding: str, body: bytes) -> list:
+        """Pre-encode the full header list for one bundle variant."""
+        headers = {
+            **CORS_HEADERS,
+            "Cache-Control": "public, max-age=3600, must-revalidate",
+            "X-Content-Type-Options": "nosniff",
+            "Content-Type": "application/javascript; charset=utf-8",
+            "Vary": "Accept-Encoding",
+            "ETag": etag,
+            "Content-Length": str(len(body)),
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return [
+            (k.lower().encode("latin-1"), v.encode("latin-1"))
+            for k, v in headers.items()
+        ]
+
+    async def _get_encoded_variants(self, bundled_code: str) -> tuple:
+        """Get the bundle's digest and compressed variants, building once.
+
+        Compression is CPU-heavy at max quality, so it runs off the event
+        loop and only when the bundle content actually changed. The digest
+        doubles as the ETag value.
+        """
+        raw = bundled_code.encode('utf-8')
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        cached_digest, variants = self._encoded_cache
+        if cached_digest == digest:
+            return digest, variants
+
+        def _compress() -> dict:
+            out = {
+                "identity": raw,
+                "gzip": gzip.compress(raw, 9),
+            }
+            if brotli is not None:
+                out["br"] = brotli.compress(raw, quality=11)
+            return out
+
+        variants = await asyncio.to_thread(_compress)
+        self._encoded_cache = (digest, variants)
+        return digest, variants
 
-    async def _serve_ui_html(self, graph_name: str, request: Request) -> Response:
+    async def _serve_ui_html(self, request: Request) -> Response:
         """Serve UI HTML with script tag
 
         Args:
-            graph_name: Name of the graph to get UI component for
             request: FastAPI request object
 
         Returns:
             HTML with script tag pointing to entrypoint.js
 
         Raises:
-            HTTPException: If graph not found or UI not configured
+            HTTPException: If the component name is missing
         """
-        # Get the message from request body
-        message = await request.json()
+        # Get the message from request body (one read, parsed with orjson)
+        body = await request.body()
+        message = _json_loads(body)
 
-        logger.info(f"UI POST request for graph: {graph_name}")
+        logger.info(f"UI POST request for graph: {self.config.graph_name}")
         logger.debug(f"Message: {message}")
 
-        # Check if this is the configured graph
-        if graph_name != self.config.graph_name:
-            logger.warning(f"UI not found for graph '{graph_name}'")
-            raise HTTPException(
-                status_code=404,
-                detail=f"UI not found for graph '{graph_name}'"
-            )
-
-        # Get host header
+        # Get host header and pick the protocol: plain http for local hosts
         host = request.headers.get('host')
+        protocol = 'http:' if host and host.split(':', 1)[0] in _LOCAL_HOSTS else ''
 
-        # Determine protocol
-        def is_host(needle: str) -> bool:
-            if not isinstance(host, str):
-                return False
-            return host.startswith(needle + ':') or host == needle
-
-        protocol = 'http:' if is_host('localhost') or is_host('127.0.0.1') else ''
-
-        # Create valid JavaScript identifier from graph name
-        valid_js_name = re.sub(r'[^a-zA-Z0-9]', '_', graph_name)
-
-        # Build the script tag
-        entrypoint_url = f"{protocol}//{host}/ui/{graph_name}/entrypoint.js"
-
-        # Parse message to get component name and props
+        # Parse message to get component name and props. A cheap prefix test
+        # picks the format instead of exception-driven control flow: only a
+        # JSON-object-shaped name can be the custom workaround payload.
         message_name = message.get("name", "")
-        try:
-            # Try to parse as JSON (custom workaround format)
-            ui_payload = json.loads(message_name)
+        ui_payload = None
+        if isinstance(message_name, str) and message_name[:1] == '{':
+            try:
+                ui_payload = _json_loads(message_name)
+            except ValueError:
+                ui_payload = None
+        if ui_payload is not None:
             component_name = ui_payload.get("name", "")
             component_props = ui_payload.get("props", {})
             logger.info(f"Parsed JSON payload - component: {component_name}")
-        except (json.JSONDecodeError, AttributeError):
-            # Fallback to direct usage (standard format)
+        else:
+            # Direct usage (standard format)
             component_name = message_name
             component_props = message.get("props", {})
             logger.info(f"Using standard format - component: {component_name}")
@@ -237,17 +364,14 @@ class UIServer:
                 detail="component_name is required and cannot be empty"
             )
 
-        # Build script tag with onload handler
-        script_tag = f'<script src="{entrypoint_url}" onload=\'__LGUI_{valid_js_name}.render({json.dumps(component_name)}, "{{{{shadowRootId}}}}", {json.dumps(component_props)})\'></script>'
+        # Build script tag with onload handler from the precomputed template
+        script_tag = self._script_tpl % (
+            protocol, host, _json_str(component_name), _json_str(component_props)
+        )
 
         return Response(
             content=script_tag,
-            headers={
-                'Content-Type': 'text/html',
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "POST, OPTIONS",
-                "Access-Control-Allow-Headers": "*",
-            }
+            headers={**CORS_HEADERS, 'Content-Type': 'text/html'},
         )
 
     async def preload_bundle(self):
@@ -264,23 +388,23 @@ class UIServer:
             logger.info(f"[UI Server] Preloading disabled for {self.config.graph_name}")
             return
 
-        logger.info(f"[UI Server] Pre-bundling components for {self.config.graph_name}...")
-        print(f"[UI Server] ⚡ Pre-bundling UI components for {self.config.graph_name}...")
+        logger.info(f"[UI Server] ⚡ Pre-bundling UI components for {self.config.graph_name}...")
 
         try:
             import time
-            start_time = time.time()
+            t0 = time.perf_counter()
 
-            bundler = get_ui_bundler()
-            await bundler.bundle_component(self.config.graph_name, self.config.ui_path)
+            # Populates the server-level response cache too, so the first
+            # request after startup is a pure cache hit
+            await self._rebuild_cached()
 
-            elapsed = time.time() - start_time
-            logger.info(f"[UI Server] ✓ Pre-bundled {self.config.graph_name} in {elapsed:.2f}s")
-            print(f"[UI Server] ✓ Pre-bundled {self.config.graph_name} in {elapsed:.2f}s (cached for instant renders)")
+            elapsed = time.perf_counter() - t0
+            logger.info(f"[UI Server] ✓ Pre-bundled {self.config.graph_name} in {elapsed:.2f}s (cached for instant renders)")
         except Exception as e:
-            logger.error(f"[UI Server] Failed to pre-bundle {self.config.graph_name}: {e}")
-            print(f"[UI Server] ✗ Failed to pre-bundle {self.config.graph_name}: {e}")
-            print(f"[UI Server]   Components will bundle on-demand instead.")
+            logger.error(
+                f"[UI Server] ✗ Failed to pre-bundle {self.config.graph_name}: {e} "
+                f"- components will bundle on-demand instead."
+            )
 
     def create_tool(self):
         """Create a push_ui_message tool for use with LLM agents
@@ -3,6 +3,17 @@ import json
 import logging
 from typing import Dict, Any
 
+# orjson serializes the payload dicts several times faster than stdlib
+# json; fall back to stdlib when not installed.
+try:
+    import orjson
+
+    def _json_str(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:  # pragma: no cover - orjson is a normal dependency
+    def _json_str(obj) -> str:
+        return json.dumps(obj)
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,6 +36,14 @@ def create_push_ui_message_tool(graph_name: str):
         push_ui_tool = create_push_ui_message_tool("my_app")
         agent = LlmAgent(tools=[push_ui_tool])
     """
+    # Memo for repeated (component, props) renders - chatty agents re-push
+    # identical skeletons/merges, so the serialized payload is reusable.
+    # Only flat, hashable props qualify; anything else serializes fresh.
+    # Bounded LRU (dicts iterate in insertion order, so popping the first
+    # key evicts the least recently used): agents pushing ever-varying
+    # props must not grow the memo without limit.
+    _result_cache: Dict[tuple, str] = {}
+    _cache_max = 256
 
     def push_ui_message(component_name: str, props: Dict[str, Any]) -> str:
         """Push a UI component to the frontend.
@@ -45,7 +64,17 @@ def create_push_ui_message_tool(graph_name: str):
             push_ui_message("weather", {"location": "San Francisco", "temp": 72})
         """
         logger.info(f"[push_ui_message] Tool called: component={component_name}, props={props}")
-        print(f"[push_ui_message] Tool called: component={component_name}, props={props}")
+
+        try:
+            cache_key = (component_name, tuple(sorted(props.items())))
+            cached = _result_cache.pop(cache_key, None)
+            if cached is not None:
+                # Re-insert at the back - most recently used
+                _result_cache[cache_key] = cached
+                return cached
+        except TypeError:
+            # Nested/unhashable props - serialize fresh
+            cache_key = None
 
         # Return JSON payload that the frontend will intercept
         result = {
@@ -55,9 +84,13 @@ def create_push_ui_message_tool(graph_name: str):
         }
 
         logger.info(f"[push_ui_message] Returning result: {result}")
-        print(f"[push_ui_message] Returning result: {result}")
 
-        return json.dumps(result)
+        payload = _json_str(result)
+        if cache_key is not None:
+            if len(_result_cache) >= _cache_max:
+                _result_cache.pop(next(iter(_result_cache)))
+            _result_cache[cache_key] = payload
+        return payload
 
     # Set metadata for the tool
     push_ui_message.__name__ = "push_ui_message"
@@ -104,4 +137,4 @@ def push_ui_message_generic(
         "props": props
     }
 
-    return json.dumps(result)
+    return _json_str(result)
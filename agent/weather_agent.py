@@ -1,20 +1,29 @@
 """Custom ADK Weather Agent with Full Granular Control."""
 
+import os
+
 from dotenv import load_dotenv
-load_dotenv()
+
+# Parse .env only once per process - modules importing each other (or tests
+# importing several entrypoints) shouldn't re-walk the filesystem.
+if not os.getenv("_DOTENV_LOADED"):
+    load_dotenv()
+    os.environ["_DOTENV_LOADED"] = "1"
 
 from google.adk.agents import BaseAgent
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.events import Event
-from ag_ui_adk import ADKAgent, add_adk_fastapi_endpoint
+from ag_ui_adk import ADKAgent
 from google.genai import Client
 from google.genai import types
-from fastapi import FastAPI, Request
 from sidd_agent_ui_sdk import UIManager
-import os
+from _app_factory import build_adk_app
+import asyncio
+import functools
 import logging
 import random
 import json
+import time
 from typing import AsyncGenerator
 
 # Setup logging
@@ -24,6 +33,32 @@ logger = logging.getLogger(__name__)
 # Initialize UI Manager
 ui = UIManager(graph_name="weather_app", ui_path="./ui/index.tsx")
 
+# Dedicated PRNG instance: avoids the lock on the global random module state
+_rng = random.Random()
+
+# Per-worker TTL cache for weather lookups: location -> (temp, expiry)
+# Workers don't share memory, so no lock is needed.
+_weather_cache: dict[str, tuple[int, float]] = {}
+_WEATHER_CACHE_TTL = 60.0  # seconds
+
+
+@functools.lru_cache(maxsize=1024)
+def _component_id(loc_key: str) -> str:
+    """Stable UI component id for a lowercased location key.
+
+    Interned via lru_cache so repeat requests for hot locations reuse the
+    same string object - which is also what SSE client-side dedup keys on.
+    """
+    return f"weather-{loc_key}"
+
+
+def _cached_temp(loc_key: str) -> int | None:
+    """Return the cached temperature for a lowercased location key, or None if cold/expired."""
+    cached = _weather_cache.get(loc_key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    return None
+
 
 # ============================================================================
 # Tool Implementation
@@ -32,7 +67,13 @@ ui = UIManager(graph_name="weather_app", ui_path="./ui/index.tsx")
 def get_weather(location: str) -> dict:
     """Get weather information for a location."""
     logger.info(f"[get_weather] location={location}")
-    temp = random.randint(45, 85)
+
+    # Lowercase once; reused as the cache key
+    loc_key = location.lower()
+    temp = _cached_temp(loc_key)
+    if temp is None:
+        temp = _rng.randint(45, 85)
+        _weather_cache[loc_key] = (temp, time.monotonic() + _WEATHER_CACHE_TTL)
 
     result = {
         "location": location,
@@ -44,23 +85,6 @@ def get_weather(location: str) -> dict:
     return result
 
 
-# ============================================================================
-# Session Middleware
-# ============================================================================
-
-async def session_middleware(request: Request, call_next):
-    """Extract session ID and set it for streaming."""
-    session_id = (
-        request.headers.get("X-Session-ID") or
-        request.query_params.get("session") or
-        "demo-session"
-    )
-    ui.set_session(session_id)
-    logger.debug(f"Session set: {session_id}")
-    response = await call_next(request)
-    return response
-
-
 # ============================================================================
 # Custom Weather Agent with Full Control
 # ============================================================================
@@ -89,6 +113,26 @@ class CustomWeatherAgent(BaseAgent):
         object.__setattr__(self, 'client', Client(api_key=os.getenv("GOOGLE_API_KEY")))
         object.__setattr__(self, 'model_id', "gemini-2.0-flash-exp")
 
+        # The tool declaration and generation configs never change, and each
+        # is a full Pydantic tree - build them once instead of per turn.
+        object.__setattr__(self, '_tool_decl', self._get_weather_tool_declaration())
+        object.__setattr__(self, '_gen_config', types.GenerateContentConfig(
+            tools=[self._tool_decl],
+            temperature=0.7
+        ))
+        object.__setattr__(self, '_final_gen_config', types.GenerateContentConfig(
+            temperature=0.7
+        ))
+        object.__setattr__(self, '_system_msgs', (
+            types.Content(
+                role="user",
+                parts=[types.Part(text="""You are a weather assistant. When asked about weather:
+1. ALWAYS call get_weather(location) FIRST
+2. Then provide a conversational response using the actual temperature from the function result
+3. Be concise and accurate""")]
+            ),
+        ))
+
     def _get_weather_tool_declaration(self):
         """Get the function declaration for get_weather."""
         return types.Tool(function_declarations=[
@@ -135,16 +179,13 @@ class CustomWeatherAgent(BaseAgent):
             contents = self._build_conversation_history(context)
             contents.append(types.Content(role="user", parts=[types.Part(text=user_message)]))
 
-            # STEP 1: Call LLM with tools
+            # STEP 1: Call LLM with tools (async client - a blocking call here
+            # would stall every other request and SSE stream on this worker)
             logger.info("🤖 Calling LLM with tools...")
-            config = types.GenerateContentConfig(
-                tools=[self._get_weather_tool_declaration()],
-                temperature=0.7
-            )
-            response = self.client.models.generate_content(
+            response = await self.client.aio.models.generate_content(
                 model=self.model_id,
                 contents=contents,
-                config=config
+                config=self._gen_config
             )
 
             # Check if LLM wants to call a function
@@ -157,22 +198,26 @@ class CustomWeatherAgent(BaseAgent):
 
                     if func_call.name == "get_weather":
                         location = func_call.args.get("location", "Unknown")
-                        component_id = f"weather-{location.lower()}"
+                        loc_key = location.lower()
+                        component_id = _component_id(loc_key)
 
                         # STEP 2: Emit skeleton (streaming)
-                        logger.info(f"📡 Emitting skeleton for {location}")
-                        ui.emit("weather", {
-                            "location": location,
-                            "temp": "Loading..."
-                        }, id=component_id)
-
-                        # Yield control to allow SSE stream to flush the skeleton event
-                        import asyncio
-                        await asyncio.sleep(0.1)  # Small delay to ensure event is sent
-
-                        # STEP 3: Execute function
+                        # Cache hits go straight to the merge - the data is already known
+                        if _cached_temp(loc_key) is None:
+                            logger.info(f"📡 Emitting skeleton for {location}")
+                            ui.emit("weather", {
+                                "location": location,
+                                "temp": "Loading..."
+                            }, id=component_id)
+
+                            # Yield control once so the SSE stream can flush
+                            # the skeleton event - no fixed delay needed
+                            await asyncio.sleep(0)
+
+                        # STEP 3: Execute function off the event loop (cheap
+                        # today, but a real lookup would be blocking IO)
                         logger.info(f"⚙️ Executing get_weather({location})")
-                        weather_data = get_weather(location)
+                        weather_data = await asyncio.to_thread(get_weather, location)
 
                         # STEP 4: Emit merge (streaming)
                         logger.info(f"🔄 Emitting merge for {location}")
@@ -199,10 +244,10 @@ class CustomWeatherAgent(BaseAgent):
 
                         # STEP 7: Call LLM again for final response
                         logger.info("🤖 Calling LLM for final response...")
-                        final_response = self.client.models.generate_content(
+                        final_response = await self.client.aio.models.generate_content(
                             model=self.model_id,
                             contents=contents,
-                            config=types.GenerateContentConfig(temperature=0.7)
+                            config=self._final_gen_config
                         )
 
                         # Extract text
@@ -233,16 +278,8 @@ class CustomWeatherAgent(BaseAgent):
 
     def _build_conversation_history(self, context: InvocationContext) -> list:
         """Build conversation history from context."""
-        # System instruction as first message
-        return [
-            types.Content(
-                role="user",
-                parts=[types.Part(text="""You are a weather assistant. When asked about weather:
-1. ALWAYS call get_weather(location) FIRST
-2. Then provide a conversational response using the actual temperature from the function result
-3. Be concise and accurate""")]
-            )
-        ]
+        # System instruction as first message, validated once in __init__
+        return list(self._system_msgs)
 
 
 # ============================================================================
@@ -261,23 +298,8 @@ adk_weather_agent = ADKAgent(
     use_in_memory_services=True
 )
 
-# Create FastAPI app
-app = FastAPI(lifespan=ui.lifespan)
-
-# Add session middleware
-app.middleware("http")(session_middleware)
-
-# Add UI router
-app.include_router(ui.router)
-
-# Add ADK agent endpoint
-add_adk_fastapi_endpoint(app, adk_weather_agent, path="/")
-
-
-@app.get("/health")
-def health():
-    """Health check endpoint."""
-    return {"status": "ok", "agent": "custom"}
+# Create FastAPI app (shared session middleware / UI router / health wiring)
+app = build_adk_app(adk_weather_agent, ui, health_payload={"status": "ok", "agent": "custom"})
 
 
 if __name__ == "__main__":
@@ -286,4 +308,18 @@ if __name__ == "__main__":
         print("⚠️  Set GOOGLE_API_KEY environment variable")
     port = int(os.getenv("PORT", 8000))
     print(f"\n🚀 Starting Custom Weather Agent on port {port}\n")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Import string (not the app object) is required for multi-worker mode.
+    uvicorn.run(
+        "weather_agent:app",
+        host="0.0.0.0",
+        port=port,
+        # SSE session queues, the weather caches and the prefetch table
+        # are all per-process and there is no sticky routing, so >1
+        # worker silently drops ui.emit events whenever the stream and
+        # the agent POST land on different workers. Opt in via
+        # UVICORN_WORKERS once the deployment has session affinity.
+        workers=int(os.getenv("UVICORN_WORKERS", "1")),
+        loop="uvloop",
+        http="httptools",
+        log_level=os.getenv("UVICORN_LOG_LEVEL", "warning"),
+    )
@@ -3,44 +3,106 @@
 import os
 import random
 import logging
+import re
 from typing import TypedDict, Annotated, Literal
 import json
-import sqlite3 # <--- ADDED
 
+import aiosqlite
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, START, END
-from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.checkpoint.sqlite import SqliteSaver # <--- ADDED
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver # <--- ADDED
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 import asyncio
+import functools
+import time
+from uuid import uuid4
 from sidd_agent_ui_sdk import UIManager
 
-# Load environment variables
-load_dotenv()
+# Load environment variables (once per process)
+if not os.getenv("_DOTENV_LOADED"):
+    load_dotenv()
+    os.environ["_DOTENV_LOADED"] = "1"
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# orjson serializes the small tool-result dicts several times faster than
+# stdlib json; fall back to stdlib when not installed.
+try:
+    import orjson
+
+    def _json_str(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:  # pragma: no cover - orjson is a normal dependency
+    def _json_str(obj) -> str:
+        return json.dumps(obj)
+
 # Initialize UI Manager
 ui = UIManager(graph_name="weather_app", ui_path="./ui/index.tsx")
 
+# Dedicated PRNG instance: avoids the lock on the global random module state
+_rng = random.Random()
+
+# Per-worker TTL cache for weather lookups: location -> (temp, expiry).
+# Weather doesn't change on sub-minute scales, so repeat queries for the
+# same city inside the window skip the lookup entirely.
+_weather_cache: dict[str, tuple[int, float]] = {}
+_WEATHER_CACHE_TTL = 60.0  # seconds
+
 
 # ============================================================================
 # State Definition
 # ============================================================================
 
+def fast_add_messages(left: list[BaseMessage], right: list[BaseMessage]) -> list[BaseMessage]:
+    """Append-only message reducer, deduplicated by message id.
+
+    The default add_messages reducer coerces and scans every message in
+    both lists each step - O(N) Python-level work per turn in history
+    length. This graph only ever appends fully-formed messages, so a
+    shallow copy plus an id-set probe for the k new messages is enough;
+    updates-by-id and RemoveMessage handling are features the graph
+    doesn't use.
+    """
+    if not right:
+        return left
+    if not left:
+        return list(right)
+    seen = {m.id for m in left if m.id}
+    out = list(left)
+    out.extend(m for m in right if m.id is None or m.id not in seen)
+    return out
+
+
 class WeatherState(TypedDict):
     """State for the weather agent graph."""
-    messages: Annotated[list[BaseMessage], add_messages]
+    messages: Annotated[list[BaseMessage], fast_add_messages]
     weather_location: str | None
     weather_temp: int | None
+    # tool_call_id -> component_id, filled by weather_agent when it emits
+    # a skeleton so tool_handler reuses the id instead of re-deriving it
+    tool_call_meta: dict[str, str] | None
+    # component_id -> last emitted props; lets repeat queries skip
+    # re-sending frames the client has already rendered
+    ui_components: dict[str, dict] | None
+
+
+@functools.lru_cache(maxsize=1024)
+def _component_id(loc_key: str) -> str:
+    """Stable UI component id for a lowercased location key.
+
+    Interned via lru_cache so the skeleton emit, the merge emit, and any
+    repeat query for the same city all share one string object instead of
+    rebuilding (and re-hashing) the f-string in each node.
+    """
+    return f"weather-{loc_key}"
 
 
 # ============================================================================
@@ -58,7 +120,7 @@ def push_ui_message(component_name: str, props: dict) -> dict:
     Returns:
         Dict with graph_name, component_name, and props
     """
-    logger.info(f"[push_ui_message] component={component_name}, props={props}")
+    logger.info("[push_ui_message] component=%s, props=%s", component_name, props)
 
     result = {
         "graph_name": "weather_app",
@@ -66,7 +128,7 @@ def push_ui_message(component_name: str, props: dict) -> dict:
         "props": props
     }
 
-    logger.info(f"[push_ui_message] result={result}")
+    logger.info("[push_ui_message] result=%s", result)
     return result
 
 
@@ -80,10 +142,17 @@ def get_weather(location: str) -> dict:
     Returns:
         Dict with location and temperature
     """
-    logger.info(f"[get_weather] location={location}")
-
-    # Mock weather data
-    temp = random.randint(45, 70)
+    logger.info("[get_weather] location=%s", location)
+
+    # Lowercase once; reused as the cache key
+    loc_key = location.strip().lower()
+    cached = _weather_cache.get(loc_key)
+    if cached and cached[1] > time.monotonic():
+        temp = cached[0]
+    else:
+        # Mock weather data
+        temp = _rng.randint(45, 70)
+        _weather_cache[loc_key] = (temp, time.monotonic() + _WEATHER_CACHE_TTL)
 
     result = {
         "location": location,
@@ -91,161 +160,503 @@ def get_weather(location: str) -> dict:
         "status": "success"
     }
 
-    logger.info(f"[get_weather] result={result}")
+    logger.info("[get_weather] result=%s", result)
     return result
 
 
+# System instruction to prevent city confusion. Built once - the content
+# never changes, and the checkpointer never persists it (weather_agent
+# prepends it to its local copy of the history each turn).
+_SYSTEM_MSG = SystemMessage(content="""You are a weather assistant.
+When the user asks about a city's weather:
+1. Call get_weather(location="CityName") to get the current data
+2. Call push_ui_message with the weather data
+3. Respond ONLY about the city the user JUST asked about - do NOT mention previous cities
+
+IMPORTANT: Always respond about the CURRENT query, not previous queries in the conversation.""")
+
+# Sliding window sent to the LLM each turn (system message excluded). The
+# checkpointer still persists the full history; this only bounds prompt
+# tokens, which otherwise grow linearly with turn count.
+_MAX_HISTORY = int(os.getenv("WEATHER_MAX_HISTORY", "12"))
+
+
+def _safe_prune(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """Trim history to the system message plus the last _MAX_HISTORY entries.
+
+    The cut never opens the window on a ToolMessage: the start index walks
+    back until the AIMessage that issued the matching tool calls is inside
+    the window, since the API rejects tool responses without their call.
+    """
+    if len(messages) <= _MAX_HISTORY + 1:
+        return messages
+    start = len(messages) - _MAX_HISTORY
+    while start > 1 and isinstance(messages[start], ToolMessage):
+        start -= 1
+    return [messages[0], *messages[start:]]
+
+
 # ============================================================================
-# Agent Nodes
+# LLM Construction (cached)
 # ============================================================================
 
-async def weather_agent(state: WeatherState) -> WeatherState:
-    """Main weather agent that processes user requests."""
-    logger.info("="*80)
-    logger.info("WEATHER AGENT NODE")
-    logger.info("="*80)
-
-    messages = state["messages"]
-    logger.info(f"Processing {len(messages)} messages")
+@functools.lru_cache(maxsize=1)
+def _base_llm():
+    """Build the chat model once per process.
 
-    # Initialize LLM with tools and system instruction
-    llm = ChatGoogleGenerativeAI(
+    Constructing ChatGoogleGenerativeAI validates config and sets up the
+    underlying client on every call - there's no reason to pay that per
+    graph turn when the model and temperature never change.
+    """
+    return ChatGoogleGenerativeAI(
         model="gemini-2.5-flash-lite-preview-09-2025",
         temperature=0,
     )
-    # llm = ChatGoogleGenerativeAI(
+    # return ChatGoogleGenerativeAI(
     #     model="gemini-2.0-flash-exp",
     #     temperature=0.7,
     # )
-    # llm = ChatAnthropic(
+    # return ChatAnthropic(
     #     temperature=0,
     #     model_name="claude-sonnet-4-5-20250929",
     #     timeout=None,
     #     stop=None
     # )
 
-    # Add system instruction to prevent city confusion
-    if not any(isinstance(msg, SystemMessage) for msg in messages):
-        system_msg = SystemMessage(content="""You are a weather assistant.
-When the user asks about a city's weather:
-1. Call get_weather(location="CityName") to get the current data
-2. Call push_ui_message with the weather data
-3. Respond ONLY about the city the user JUST asked about - do NOT mention previous cities
 
-IMPORTANT: Always respond about the CURRENT query, not previous queries in the conversation.""")
-        messages = [system_msg] + messages
+# bind_tools re-runs Pydantic schema introspection on every call; the
+# converter it uses internally is importable, so the declarations can be
+# built once and shared by every bound mode. Private-module import, hence
+# the guard - bind_tools stays as the fallback.
+try:
+    from langchain_google_genai._function_utils import (
+        convert_to_genai_function_declarations as _to_genai_declarations,
+    )
+except ImportError:  # pragma: no cover - moved upstream
+    _to_genai_declarations = None
 
-    # Hybrid approach: streaming for live updates, tool for chat history
-    tools = [get_weather, push_ui_message]
 
-    # 3. DYNAMIC CONFIGURATION LOGIC
-    # Default: Model calls tools if it wants to ("AUTO")
-    tool_mode = "AUTO" 
+@functools.lru_cache(maxsize=1)
+def _tool_declarations():
+    """Serialize the tool schemas to GenAI declarations exactly once."""
+    return [_to_genai_declarations([get_weather, push_ui_message])]
 
-    # Check the history to see if we are done with tools
-    if messages:
-        last_msg = messages[-1]
-        
-        # If the last message was a ToolMessage (the result of a tool)
-        if hasattr(last_msg, 'tool_call_id'):
-            
-            # We need to determine WHICH tool just finished. 
-            # In LangChain, we have to look back at the AIMessage preceding this ToolMessage
-            # to find the name, OR verify the artifact.
-            
-            # Heuristic: If we see a ToolMessage, checking if the graph has done its job.
-            # Since your flow is Get Weather -> Push UI -> Done, we can simply check
-            # if 'push_ui_message' was the tool that just ran.
-            
-            # Find the AIMessage that triggered this tool
-            # (We look at the second to last message)
-            if len(messages) >= 2:
-                preceding_ai_msg = messages[-2]
-                if hasattr(preceding_ai_msg, 'tool_calls'):
-                    for tc in preceding_ai_msg.tool_calls:
-                        if tc['name'] == 'push_ui_message':
-                            logger.info("🛑 Detected push_ui_message completion. Forcing mode=NONE")
-                            tool_mode = "NONE"
-
-    # 4. Bind tools with the DYNAMIC configuration
-    # 'mode': 'NONE' tells the API: "Do NOT generate a tool call, you MUST generate text."
-    llm_with_tools = llm.bind_tools(
-        tools, 
-        tool_config={
-            "function_calling_config": {
-                "mode": tool_mode
-            }
+
+@functools.lru_cache(maxsize=None)
+def _llm_with_tools(tool_mode: str):
+    """Return the tool-bound model for a function-calling mode.
+
+    Only "AUTO" and "NONE" occur in practice, so each bound Runnable is
+    computed once and reused thereafter - and both share one prebuilt
+    tool declaration instead of re-introspecting the schemas per mode.
+    'NONE' tells the API: "Do NOT generate a tool call, you MUST generate
+    text."
+    """
+    tool_config = {
+        "function_calling_config": {
+            "mode": tool_mode
         }
-    )
+    }
+    if _to_genai_declarations is not None:
+        return _base_llm().bind(tools=_tool_declarations(), tool_config=tool_config)
+    return _base_llm().bind_tools([get_weather, push_ui_message], tool_config=tool_config)
+
+
+# ============================================================================
+# Opt-in LLM micro-batching (AGENT_BATCH=1)
+# ============================================================================
+
+_AGENT_BATCH = os.getenv("AGENT_BATCH") == "1"
+
+
+class LLMBatcher:
+    """Fold concurrent text-only LLM turns into one Gemini request.
+
+    Under concurrent load, N users finishing their turns within a few
+    milliseconds of each other produce N small requests that each pay
+    full per-request overhead (TLS, auth, scheduling, a rate-limit
+    slot). The batcher collects submissions arriving within a short
+    window, packs them into one numbered prompt, and demuxes the
+    JSON-keyed answer back onto each caller's future.
+
+    Only text-final turns (tool mode NONE) are batched - tool-calling
+    turns can't share a prompt without losing their structured calls.
+    """
+
+    def __init__(self, max_batch: int = 8, max_wait_ms: float = 20.0):
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000.0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._consumer: asyncio.Task | None = None
+
+    async def submit(self, messages: list[BaseMessage]) -> AIMessage:
+        """Queue one conversation; resolves to its final AIMessage."""
+        if self._consumer is None:
+            self._consumer = asyncio.create_task(self._consume())
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((messages, fut))
+        return await fut
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [(await self._queue.get())]
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            if len(batch) == 1:
+                # Nothing to amortize - plain call, no demux risk
+                messages, fut = batch[0]
+                await self._resolve_single(messages, fut)
+                continue
+            await self._run_batch(batch)
+
+    @staticmethod
+    async def _resolve_single(messages, fut):
+        if fut.cancelled():
+            return
+        try:
+            fut.set_result(await _llm_with_tools("NONE").ainvoke(messages))
+        except Exception as exc:
+            fut.set_exception(exc)
+
+    @staticmethod
+    def _render(messages: list[BaseMessage]) -> str:
+        lines = []
+        for msg in messages:
+            role = ("user" if isinstance(msg, HumanMessage)
+                    else "assistant" if isinstance(msg, AIMessage)
+                    else "system" if isinstance(msg, SystemMessage)
+                    else "tool")
+            content = msg.content if isinstance(msg.content, str) else _json_str(msg.content)
+            lines.append(f"{role}: {content}")
+        return "\n".join(lines)
+
+    async def _run_batch(self, batch):
+        prompt = (
+            "Answer each numbered conversation below independently.\n"
+            "Reply with ONLY a JSON object mapping each conversation number "
+            '(as a string) to your reply text, e.g. {"0": "...", "1": "..."}.\n\n'
+        )
+        prompt += "\n\n".join(
+            f"--- Conversation {i} ---\n{self._render(messages)}"
+            for i, (messages, _) in enumerate(batch)
+        )
+        try:
+            reply = await _base_llm().ainvoke([HumanMessage(content=prompt)])
+            text = reply.content if isinstance(reply.content, str) else str(reply.content)
+            answers = json.loads(text[text.find("{"):text.rfind("}") + 1])
+        except Exception:
+            logger.exception("Batch demux failed; falling back to per-turn calls")
+            for messages, fut in batch:
+                await self._resolve_single(messages, fut)
+            return
+        for i, (_, fut) in enumerate(batch):
+            if not fut.cancelled():
+                fut.set_result(AIMessage(content=str(answers.get(str(i), ""))))
+
+
+@functools.lru_cache(maxsize=1)
+def _batcher() -> LLMBatcher:
+    return LLMBatcher()
+
+
+# ============================================================================
+# Speculative tool prefetch
+# ============================================================================
+
+# Cheap guess at the city a message asks about, used to start get_weather
+# before the LLM has even named its tool call
+_CITY_RE = re.compile(r"weather (?:in|for|at) ([A-Za-z][A-Za-z\s\-]*)", re.IGNORECASE)
+
+# In-flight speculative get_weather tasks keyed by (thread_id, lowered
+# location). Lives at module scope: a running asyncio.Task can't ride
+# through the checkpointed WeatherState. Scoping by thread_id keeps one
+# session's cancel sweep from killing another session's prefetch.
+_prefetch_tasks: dict[tuple[str, str], asyncio.Task] = {}
+
+
+def _thread_id(config: RunnableConfig | None) -> str:
+    """Thread id for the current run, or '' when invoked without one."""
+    return str(((config or {}).get("configurable") or {}).get("thread_id", ""))
+
+
+def _start_prefetch(thread_id: str, user_text: str) -> None:
+    """Speculatively start get_weather if the message names a city.
+
+    The LLM roundtrip and the weather lookup are otherwise strictly
+    serial; kicking the lookup off here overlaps the two, and
+    tool_handler awaits the in-flight task when the LLM's tool call
+    matches the guess.
+    """
+    m = _CITY_RE.search(user_text)
+    if not m:
+        return
+    city = m.group(1).strip()
+    key = (thread_id, city.lower())
+    if key not in _prefetch_tasks:
+        logger.info("🔮 Speculative get_weather(%s) started", city)
+        _prefetch_tasks[key] = asyncio.create_task(get_weather.ainvoke({"location": city}))
+
+
+def _cancel_stale_prefetches(thread_id: str, wanted_keys: set[str]) -> None:
+    """Cancel this thread's speculative tasks its tool calls didn't confirm."""
+    for key in list(_prefetch_tasks):
+        if key[0] == thread_id and key[1] not in wanted_keys:
+            _prefetch_tasks.pop(key).cancel()
+
+
+# ============================================================================
+# Agent Nodes
+# ============================================================================
+
+async def weather_agent(state: WeatherState, config: RunnableConfig | None = None) -> WeatherState:
+    """Main weather agent that processes user requests."""
+    logger.info("="*80)
+    logger.info("WEATHER AGENT NODE")
+    logger.info("="*80)
+
+    messages = state["messages"]
+    logger.info("Processing %d messages", len(messages))
+
+    # Add system instruction to prevent city confusion. The checkpointer
+    # never persists it, so an O(1) probe of the head replaces the old
+    # full-history isinstance scan - constant cost however long the
+    # conversation gets.
+    if not (messages and isinstance(messages[0], SystemMessage)):
+        messages = [_SYSTEM_MSG, *messages]
 
-    # Call LLM
-    response = await llm_with_tools.ainvoke(messages)
-    
-    # STREAMING (Phase 2): Emit skeleton immediately!
-    if hasattr(response, 'tool_calls') and response.tool_calls:
-        for tool_call in response.tool_calls:
+    # Bound what we send to the LLM; state keeps the full history
+    messages = _safe_prune(messages)
+
+    # 3. DYNAMIC CONFIGURATION LOGIC
+    # Default: Model calls tools if it wants to ("AUTO")
+    tool_mode = "AUTO"
+
+    # Check whether we are done with tools. The answer lives entirely in
+    # the last two messages: a ToolMessage tail whose triggering AIMessage
+    # called push_ui_message means the flow (Get Weather -> Push UI) is
+    # complete - so peek the tail directly instead of walking history.
+    # Since your flow is Get Weather -> Push UI -> Done, we can simply check
+    # if 'push_ui_message' was the tool that just ran.
+    # 'NONE' tells the API: "Do NOT generate a tool call, you MUST generate text."
+    if len(messages) >= 2 and isinstance(messages[-1], ToolMessage):
+        preceding = messages[-2]
+        for tc in (preceding.tool_calls if isinstance(preceding, AIMessage) else []):
+            if tc['name'] == 'push_ui_message':
+                logger.info("🛑 Detected push_ui_message completion. Forcing mode=NONE")
+                tool_mode = "NONE"
+                break
+
+    # 4. Pick the pre-bound model for the DYNAMIC configuration
+    llm_with_tools = _llm_with_tools(tool_mode)
+
+    # Opt-in micro-batching: final text-only turns from concurrent users
+    # share one Gemini request (no token streaming on this path)
+    if _AGENT_BATCH and tool_mode == "NONE":
+        response = await _batcher().submit(messages)
+        if response.content:
+            ui.emit("assistant-text", {"text": response.content},
+                    id=f"msg-{uuid4().hex}", merge=True)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Agent response (batched): %r", response)
+        return {"messages": [response]}
+
+    # Overlap the weather lookup with the LLM roundtrip when the newest
+    # user message names a city outright
+    thread_id = _thread_id(config)
+    if tool_mode == "AUTO":
+        last_msg = messages[-1]
+        if isinstance(last_msg, HumanMessage) and isinstance(last_msg.content, str):
+            _start_prefetch(thread_id, last_msg.content)
+
+    # Call LLM - stream instead of waiting for the full response, so the UI
+    # gets its first token after one token's latency instead of N tokens'.
+    # LangChain merges AIMessageChunks with '+', so the aggregate we return
+    # to the graph is the same AIMessage ainvoke would have produced.
+    response = None
+    text_id = f"msg-{uuid4().hex}"
+    text_so_far = ""
+    skeletons_emitted: set[str] = set()
+    tool_call_meta: dict[str, str] = {}
+    # Components the client already rendered in earlier turns - don't
+    # flash a "Loading..." skeleton over live data on a repeat query
+    ui_components = state.get("ui_components") or {}
+
+    async for chunk in llm_with_tools.astream(messages):
+        response = chunk if response is None else response + chunk
+
+        # Stream text as it arrives. Each frame carries the accumulated
+        # text, not the delta: merge frames on one id are folded
+        # last-write-wins by the SSE coalescer (and the client), so deltas
+        # sharing a flush window would silently drop text.
+        if chunk.content:
+            if isinstance(chunk.content, str):
+                text_so_far += chunk.content
+            else:
+                text_so_far += "".join(
+                    block.get("text", "") for block in chunk.content
+                    if isinstance(block, dict)
+                )
+            ui.emit("assistant-text", {"text": text_so_far}, id=text_id, merge=True)
+
+        # STREAMING (Phase 2): Emit the skeleton as soon as the aggregated
+        # tool-call args contain a usable location - don't wait for the
+        # stream to finish. .tool_calls parses the accumulated args and
+        # only yields complete calls.
+        for tool_call in (response.tool_calls or []):
             if tool_call['name'] == 'get_weather':
-                location = tool_call['args'].get('location', 'Unknown')
-                # Generate stable ID based on location
-                component_id = f"weather-{location.lower()}"
-                logger.info(f"📡 STREAMING: Skeleton for {location} (id={component_id})")
+                location = tool_call['args'].get('location')
+                if not location:
+                    continue
+                # Generate stable ID based on location (lowered once here;
+                # tool_handler picks it up from tool_call_meta)
+                component_id = _component_id(location.lower())
+                if tool_call.get('id'):
+                    tool_call_meta[tool_call['id']] = component_id
+                if component_id in skeletons_emitted or component_id in ui_components:
+                    continue
+                skeletons_emitted.add(component_id)
+                logger.info("📡 STREAMING: Skeleton for %s (id=%s)", location, component_id)
                 # ============================================================================
                 # UI SDK Emit Loading
                 # ============================================================================
                 ui.emit("weather", {"location": location, "temp": "Loading..."}, id=component_id)
-                await asyncio.sleep(0.1)
 
-    logger.info(f"Agent response: {response}")
-    logger.info("="*80)
+    if response is None:
+        # Empty stream (shouldn't happen) - fall back to a plain call
+        response = await llm_with_tools.ainvoke(messages)
+
+    # Drop this thread's speculative lookups the model didn't ask for
+    _cancel_stale_prefetches(thread_id, {
+        tc['args'].get('location', '').lower()
+        for tc in (response.tool_calls or [])
+        if tc['name'] == 'get_weather'
+    })
+
+    # The full AIMessage repr can be multi-KB; only build it when INFO
+    # will actually be written
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Agent response: %r", response)
+        logger.info("=" * 80)
+
+    return {"messages": [response], "tool_call_meta": tool_call_meta}
 
-    return {"messages": [response]}
 
+# Tools the handler can dispatch, by name
+_TOOLS_BY_NAME = {"get_weather": get_weather, "push_ui_message": push_ui_message}
 
-async def tool_handler(state: WeatherState) -> WeatherState:
-    """Execute tools and update streaming UI with real data."""
+
+async def tool_handler(state: WeatherState, config: RunnableConfig | None = None) -> WeatherState:
+    """Execute tools concurrently and update streaming UI with real data.
+
+    Multi-city turns ("weather in Tokyo and Paris") produce several tool
+    calls in one AIMessage; running them through asyncio.gather collapses
+    N tool latencies into the slowest one, and each call emits its own
+    merge event the moment its data is ready.
+    """
     messages = state["messages"]
     last_message = messages[-1]
+    tool_calls = last_message.tool_calls if isinstance(last_message, AIMessage) else []
+    tool_call_meta = state.get("tool_call_meta") or {}
+    ui_components = state.get("ui_components") or {}
+    emitted: dict[str, dict] = {}
+    thread_id = _thread_id(config)
+
+    async def _run(tool_call) -> ToolMessage:
+        tool_fn = _TOOLS_BY_NAME.get(tool_call['name'])
+        if tool_fn is None:
+            return ToolMessage(
+                content=f"Unknown tool: {tool_call['name']}",
+                tool_call_id=tool_call['id'],
+            )
+
+        # Consume a speculative lookup if weather_agent started one for
+        # this city - usually already resolved by the time we get here
+        task = None
+        if tool_call['name'] == 'get_weather':
+            loc_key = tool_call['args'].get('location', '').lower()
+            task = _prefetch_tasks.pop((thread_id, loc_key), None)
+        try:
+            if task is not None:
+                try:
+                    data = await task
+                except asyncio.CancelledError:
+                    # Distinguish "the speculative task was cancelled" from
+                    # "we are being cancelled" - only the former may be
+                    # swallowed and retried
+                    if not task.cancelled():
+                        raise
+                    data = await tool_fn.ainvoke(tool_call['args'])
+                except Exception:
+                    data = await tool_fn.ainvoke(tool_call['args'])
+            else:
+                data = await tool_fn.ainvoke(tool_call['args'])
+        except Exception as exc:
+            # Mirror ToolNode(handle_tool_errors=True): hand the failure
+            # (e.g. malformed model-emitted args) back to the model as an
+            # error ToolMessage it can recover from, instead of failing
+            # the whole request
+            logger.exception("Tool %s failed", tool_call['name'])
+            return ToolMessage(
+                content=f"Error: {exc!r}\n Please fix your mistakes.",
+                tool_call_id=tool_call['id'],
+                status="error",
+            )
+
+        # STREAMING: Merge real data as soon as this call completes.
+        # Use SAME location from tool args (not result) so the ID matches
+        # the skeleton!
+        if tool_call['name'] == 'get_weather':
+            # Reuse the id weather_agent derived for the skeleton; only
+            # re-derive (one .lower() through the interning cache) if the
+            # skeleton never streamed
+            component_id = tool_call_meta.get(tool_call['id'])
+            if component_id is None:
+                component_id = _component_id(tool_call['args'].get('location', 'Unknown').lower())
+            payload = {
+                "location": data['location'],  # Display normalized name
+                "temp": data['temperature']
+            }
+            # Skip the frame entirely when the client already shows
+            # exactly this payload (repeat query, cached temperature)
+            if ui_components.get(component_id) != payload:
+                logger.info("📡 STREAMING: Merging real data (id=%s)", component_id)
+                # ============================================================
+                # UI SDK Emit Data and Merge Component
+                # ============================================================
+                ui.emit("weather", payload, id=component_id, merge=True)
+            emitted[component_id] = payload
 
-    # Execute tools (both get_weather and push_ui_message)
-    tool_node = ToolNode([get_weather, push_ui_message])
-    result = tool_node.invoke(state)
-    
-    # STREAMING: Update with real data after tool completes (Phase 2: merge!)
-    if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-        for tool_call in last_message.tool_calls:
-            if tool_call['name'] == 'get_weather':
-                # Use SAME location from tool args (not result) to ensure ID matches skeleton!
-                original_location = tool_call['args'].get('location', 'Unknown')
-                component_id = f"weather-{original_location.lower()}"
-
-                # Parse the tool result to get real weather data
-                for msg in result['messages']:
-                    if hasattr(msg, 'content') and msg.content:
-                        try:
-                            weather_data = json.loads(msg.content)
-                            logger.info(f"📡 STREAMING: Merging real data for {original_location} (id={component_id})")
-                            # ============================================================================
-                            # UI SDK Emit Data and Merge Component
-                            # ============================================================================
-                            ui.emit("weather", {
-                                "location": weather_data['location'],  # Display normalized name
-                                "temp": weather_data['temperature']
-                            }, id=component_id, merge=True)
-                            await asyncio.sleep(0.1)
-                        except Exception as e:
-                            logger.error(f"Failed to parse tool result: {e}")
+        return ToolMessage(content=_json_str(data), tool_call_id=tool_call['id'])
 
-    return result
+    # gather preserves argument order, so history stays deterministic
+    results = await asyncio.gather(*(_run(tc) for tc in tool_calls))
+    return {"messages": list(results), "ui_components": {**ui_components, **emitted}}
 
 
-def should_continue(state: WeatherState) -> Literal["tools", "end"]:
-    """Determine if we should continue to tools or end."""
+def should_continue(state: WeatherState) -> Literal["tools", "push_only", "end"]:
+    """Determine if we should continue to tools, finish the pushes, or end."""
     messages = state["messages"]
     last_message = messages[-1]
 
-    # If there are tool calls, continue to tools
-    if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-        logger.info(f"→ Routing to tools ({len(last_message.tool_calls)} calls)")
+    # If there are tool calls, continue to tools. isinstance is a plain
+    # type check; hasattr probes via try/except and pays for the miss on
+    # every text-only turn.
+    if isinstance(last_message, AIMessage) and last_message.tool_calls:
+        # A turn whose only remaining work is push_ui_message doesn't need
+        # another LLM roundtrip just to say "done" - run the pushes and
+        # end, skipping a full prefill over the history.
+        if all(tc['name'] == 'push_ui_message' for tc in last_message.tool_calls):
+            logger.info("→ Routing to push_only (%d calls)", len(last_message.tool_calls))
+            return "push_only"
+        logger.info("→ Routing to tools (%d calls)", len(last_message.tool_calls))
         return "tools"
 
     # Otherwise, end
@@ -257,10 +668,64 @@ def should_continue(state: WeatherState) -> Literal["tools", "end"]:
 # Graph Construction
 # ============================================================================
 
+# Shared saver behind the no-checkpointer fallback; kept at module scope
+# so a shutdown hook can close its connection instead of leaking one per
+# graph build.
+_fallback_saver: AsyncSqliteSaver | None = None
+
+
+class _WALAsyncSqliteSaver(AsyncSqliteSaver):
+    """AsyncSqliteSaver that applies the WAL tuning pragmas at first use.
+
+    SQLite's defaults (rollback journal, synchronous=FULL) fsync twice per
+    checkpoint write; WAL + synchronous=NORMAL turns each write into an
+    append. The pragmas need a running event loop to execute and the graph
+    factory is synchronous, so they're deferred into setup(), which every
+    saver method awaits before touching the database.
+    """
+
+    _pragmas_applied = False
+
+    async def setup(self) -> None:
+        await super().setup()
+        if not self._pragmas_applied:
+            self._pragmas_applied = True
+            await self.conn.executescript(
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA temp_store=memory;"
+                "PRAGMA cache_size=-64000;"
+            )
+
+
+def _fallback_checkpointer() -> AsyncSqliteSaver:
+    """Build the default async SQLite checkpointer on one shared connection.
+
+    The aiosqlite connection is created un-awaited here - setup() starts
+    it on first checkpoint - which keeps this callable from the
+    synchronous graph factory (invoked at import time in langgraph_weather)
+    while still giving the async-only graph a working async saver.
+    """
+    global _fallback_saver
+    if _fallback_saver is None:
+        _fallback_saver = _WALAsyncSqliteSaver(aiosqlite.connect("checkpoints.db"))
+    return _fallback_saver
+
+
+async def close_checkpoint_conn() -> None:
+    """Close the fallback checkpointer's shared connection (call on shutdown)."""
+    global _fallback_saver
+    if _fallback_saver is not None:
+        saver, _fallback_saver = _fallback_saver, None
+        # The connection thread only exists if a checkpoint ever ran
+        if saver.conn.is_alive():
+            await saver.conn.close()
+
+
 def create_weather_graph(checkpointer = None):
     """
     Create the weather agent graph.
-    
+
     Args:
         checkpointer: An initialized LangGraph checkpointer.
                       MUST be an AsyncSqliteSaver instance for production.
@@ -270,6 +735,9 @@ def create_weather_graph(checkpointer = None):
 
     workflow.add_node("agent", weather_agent)
     workflow.add_node("tools", tool_handler)
+    # Same handler, terminal wiring: push-only turns execute their UI
+    # pushes and stop instead of paying one more LLM call
+    workflow.add_node("push_only", tool_handler)
 
     workflow.add_edge(START, "agent")
     workflow.add_conditional_edges(
@@ -277,15 +745,18 @@ def create_weather_graph(checkpointer = None):
         should_continue,
         {
             "tools": "tools",
+            "push_only": "push_only",
             "end": END,
         }
     )
     workflow.add_edge("tools", "agent")
+    workflow.add_edge("push_only", END)
 
-    # Fallback to Memory if no checkpointer provided (e.g. for testing)
+    # Fallback to a durable shared-connection AsyncSqliteSaver if no
+    # checkpointer provided (production passes one from its lifespan)
     if checkpointer is None:
-        logger.warning("⚠️ No checkpointer provided. Using ephemeral MemorySaver.")
-        checkpointer = MemorySaver()
+        logger.warning("⚠️ No checkpointer provided. Using shared WAL AsyncSqliteSaver fallback.")
+        checkpointer = _fallback_checkpointer()
 
     # Compile with the provided checkpointer
     graph = workflow.compile(checkpointer=checkpointer)